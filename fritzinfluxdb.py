@@ -80,8 +80,10 @@ def main():
     # parse command line arguments
     args = parse_command_line(__version__, __description__, __version_date__, __url__, default_config)
 
+    loop = asyncio.get_event_loop()
+
     log_queue = asyncio.Queue()
-    log = setup_logging("DEBUG" if args.verbose > 0 else "INFO", args.daemon, log_queue)
+    log = setup_logging("DEBUG" if args.verbose > 0 else "INFO", args.daemon, log_queue, loop)
 
     log.propagate = False
 
@@ -138,13 +140,12 @@ def main():
              f"Model: {fritzbox_connection.config.model} ({fritzbox_connection.config.link_type}) - "
              f"FW: {fritzbox_connection.config.fw_version}")
 
-    loop = asyncio.get_event_loop()
-
     for fb_signal in [signal.SIGHUP, signal.SIGTERM, signal.SIGINT]:
         loop.add_signal_handler(
             fb_signal, lambda s=fb_signal: asyncio.create_task(shutdown(s, loop, log)))
 
-    queue = asyncio.Queue()
+    # producers have to wait if the InfluxDB handler falls behind
+    queue = asyncio.Queue(maxsize=influx_connection.max_queue_size)
 
     log.info("Starting main loop")
 
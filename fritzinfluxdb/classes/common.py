@@ -8,7 +8,10 @@
 #  repository or visit: <https://opensource.org/licenses/MIT>.
 
 import pytz
+from collections import OrderedDict
 from datetime import datetime
+from itertools import count
+from types import MappingProxyType
 import configparser
 import os
 
@@ -24,6 +27,108 @@ class WritePrecision(object):
     US = "us"
 
 
+class TagSet:
+    """
+        An interned combination of box tag and additional tags of measurements.
+        Use the TagSetRegistry to get a TagSet instead of creating one directly.
+    """
+
+    __slots__ = ("id", "box_tag", "additional_tags", "tags", "frozen", "frozen_hash", "line_protocol")
+
+    def __init__(self, tag_set_id, box_tag, additional_tags):
+
+        self.id = tag_set_id
+        self.box_tag = box_tag
+        self.additional_tags = additional_tags
+
+        tags = dict()
+        if box_tag is not None:
+            tags[FritzMeasurement.default_box_tag_key] = box_tag
+
+        if additional_tags is not None:
+            tags.update(additional_tags)
+
+        self.tags = MappingProxyType(tags)
+
+        try:
+            self.frozen = frozenset(tags.items())
+        except TypeError:
+            self.frozen = None
+
+        # equal tags result in the same hash, even if they are not interned in the same TagSet
+        self.frozen_hash = hash(self.frozen) if self.frozen is not None else hash(repr(self))
+
+        # line protocol tag string, added by the LineProtocolEncoder on first use
+        self.line_protocol = None
+
+    def __repr__(self):
+        return f"{dict(self.tags)}"
+
+
+class TagSetRegistry:
+    """
+        Holds every distinct combination of box tag and additional tags once.
+
+        The registry keeps the 'max_size' most recently used tag sets, so recurring tag sets
+        stay interned across poll cycles while changing tags can't grow the registry forever.
+
+        The id of a TagSet is unique, a tag set which got evicted and is requested again is a
+        new TagSet with a new id. Measurements keep using the evicted TagSet until they are dropped.
+    """
+
+    # max number of tag sets kept in the registry
+    max_size = 10_000
+
+    def __init__(self):
+
+        self._tag_sets = OrderedDict()
+        self._tag_set_ids = count()
+
+    def __len__(self):
+        return len(self._tag_sets)
+
+    def get(self, box_tag, additional_tags=None):
+        """
+        returns the interned TagSet for this combination of tags
+
+        Parameters
+        ----------
+        box_tag: str
+            the box tag
+        additional_tags: dict
+            additional tags of the measurement
+
+        Returns
+        -------
+        TagSet: the interned tag set
+        """
+
+        if additional_tags is not None and len(additional_tags) == 0:
+            additional_tags = None
+
+        try:
+            key = (box_tag, tuple(additional_tags.items()) if additional_tags is not None else None)
+            tag_set = self._tag_sets.get(key)
+        except TypeError:
+            # unhashable tag value, tag set can't be interned
+            return TagSet(next(self._tag_set_ids), box_tag, dict(additional_tags))
+
+        if tag_set is not None:
+            self._tag_sets.move_to_end(key)
+            return tag_set
+
+        tag_set = self._tag_sets[key] = TagSet(next(self._tag_set_ids), box_tag,
+                                               dict(additional_tags) if additional_tags is not None else None)
+
+        if len(self._tag_sets) > self.max_size:
+            self._tag_sets.popitem(last=False)
+
+        return tag_set
+
+
+tag_set_registry = TagSetRegistry()
+
+
 class FritzMeasurement:
     """
         This class holds measurements which should be sanitized to this specification
@@ -33,17 +138,20 @@ class FritzMeasurement:
     default_box_tag_key = "box"
     default_timestamp_precision = WritePrecision.S
 
-    __slots__ = ("name", "value", "box_tag", "timestamp", "additional_tags", "timestamp_precision")
+    __slots__ = ("name", "value", "tag_set", "timestamp", "timestamp_precision", "_hash", "spool_segment")
 
     def __init__(self, key, value,
                  data_type=None, box_tag=None,
                  additional_tags=None, timestamp=None,
-                 timestamp_precision=None):
+                 timestamp_precision=None, tag_set=None):
 
         # name and primary tag should always be present
         self.name = str(key)
-        self.box_tag = str(box_tag)
         self.value = None
+        self._hash = None
+
+        # InfluxDB spool segment the measurement has been loaded from, not part of hash and equality
+        self.spool_segment = None
 
         if data_type is not None:
             # noinspection PyBroadException
@@ -62,19 +170,23 @@ class FritzMeasurement:
 
         self.update_timestamp_precision(timestamp_precision)
 
-        self.additional_tags = None
-
-        if isinstance(additional_tags, dict):
-            self.additional_tags = additional_tags
+        if isinstance(tag_set, TagSet):
+            self.tag_set = tag_set
+        else:
+            self.tag_set = tag_set_registry.get(str(box_tag),
+                                                additional_tags if isinstance(additional_tags, dict) else None)
 
     def __repr__(self):
-        return f"{self.timestamp}: {self.name}={self.value} ({self.tags})"
+        return f"{self.timestamp}: {self.name}={self.value} ({self.tag_set})"
 
     def update_timestamp_precision(self, precision=None):
 
         if self.timestamp is None:
             return
 
+        # timestamp might change
+        self._hash = None
+
         if precision is None:
             precision = self.default_timestamp_precision
 
@@ -116,20 +228,42 @@ class FritzMeasurement:
 
         return value.strip()
 
+    @property
+    def box_tag(self):
+        return self.tag_set.box_tag
+
+    @property
+    def additional_tags(self):
+        return self.tag_set.additional_tags
+
     @property
     def tags(self):
+        """
+        read only mapping of all tags of this measurement, shared by all measurements with the same tags
+        """
+        return self.tag_set.tags
 
-        tags = dict()
-        if self.box_tag is not None:
-            tags[self.default_box_tag_key] = self.box_tag
+    def __hash__(self):
+        """
+        structural hash of name, value, timestamp and tags. The hash is calculated once,
+        so measurements must not be changed after they have been hashed.
+        """
 
-        if self.additional_tags is not None:
-            tags = {**tags, **self.additional_tags}
+        if self._hash is None:
+            self._hash = hash((self.name, type(self.value), self.value, self.timestamp, self.tag_set.frozen_hash))
 
-        return tags
+        return self._hash
 
-    def __hash__(self):
-        return hash(self.__repr__())
+    def __eq__(self, other):
+
+        if not isinstance(other, FritzMeasurement):
+            return NotImplemented
+
+        return self.name == other.name and \
+            type(self.value) is type(other.value) and \
+            self.value == other.value and \
+            self.timestamp == other.timestamp and \
+            (self.tag_set is other.tag_set or self.tag_set.tags == other.tag_set.tags)
 
 
 class ConfigBase:
@@ -58,6 +58,18 @@ class FritzBoxConfig(ConfigBase):
         "alt": "interval",
         "default": 10
     }
+    request_jitter = {
+        "type": int,
+        "default": 0
+    }
+    max_concurrent_requests = {
+        "type": int,
+        "default": 4
+    }
+    state_file = {
+        "type": str,
+        "default": None
+    }
     box_tag = {
         "type": str,
         "default": "fritz.box"
@@ -86,6 +98,17 @@ class FritzBoxConfig(ConfigBase):
             log.info(f"Setting minimum FritzBox request interval to {min_request_interval} seconds")
             self.request_interval = min_request_interval
 
+        if not 0 <= getattr(self, "request_jitter") <= 50:
+            log.error(f"FritzBox request jitter must be between 0 and 50 percent, got '{self.request_jitter}'")
+            self.parser_error = True
+
+        if self.state_file is not None and len(self.state_file) == 0:
+            self.state_file = None
+
+        if getattr(self, "max_concurrent_requests") < 1:
+            log.info("Setting minimum of concurrent FritzBox requests to 1")
+            self.max_concurrent_requests = 1
+
         # validate data
         for key in ["username", "password"]:
             if getattr(self, key) is None or len(getattr(self, key)) == 0:
@@ -0,0 +1,442 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import pytz
+from collections.abc import Iterable
+from datetime import datetime
+
+from fritzinfluxdb.common import compile_path
+from fritzinfluxdb.log import get_logger
+from fritzinfluxdb.classes.common import FritzMeasurement
+
+log = get_logger()
+
+scalar_types = (int, float, bool, str)
+
+
+class ExtractionContext:
+    """
+        Holds everything needed to turn the data of a single service response into measurements
+    """
+
+    __slots__ = ("service", "box_tag", "get_timestamp", "high_water_mark", "result_list", "row_cache", "timestamp")
+
+    def __init__(self, service, box_tag, get_timestamp, high_water_mark=None, result_list=None):
+        """
+        Parameters
+        ----------
+        service: FritzBoxLuaService
+            the service the response belongs to, used to track measurements
+        box_tag: str
+            the box tag to add to every measurement
+        get_timestamp: callable
+            function to turn the result of a 'timestamp_function' into a time zone aware timestamp
+        high_water_mark: float
+            only entries of lists with a 'timestamp_function' newer than this are extracted
+        result_list: list
+            list to add the extracted measurements to
+        """
+
+        self.service = service
+        self.box_tag = box_tag
+        self.get_timestamp = get_timestamp
+        self.high_water_mark = high_water_mark
+        self.result_list = result_list if result_list is not None else list()
+
+        # results of tags and prepare functions for the current row of a group step,
+        # shared by all metrics of the group
+        self.row_cache = None
+
+        # timestamp of all measurements without a 'timestamp_function'
+        self.timestamp = datetime.now(pytz.utc)
+
+    def add_measurement(self, metric):
+
+        # check if measurement is tracked and already reported
+        if self.service.skip_tracked_measurement(metric) is True:
+            return
+
+        # track measurement (if configured)
+        self.service.add_tracked_measurement(metric)
+
+        self.result_list.append(metric)
+
+
+def matches_container_type(value, data_type):
+    """
+    check if value is of the container type. Instead of a list any other iterable can be returned,
+    i.e. to parse the entries only while they are extracted.
+    """
+
+    if type(value) == data_type:
+        return True
+
+    return data_type == list and isinstance(value, Iterable) and not isinstance(value, (str, bytes, dict))
+
+
+def get_row_result(function, data, row_cache):
+    """
+    returns the result of function(data), cached in the row cache if there is one
+    """
+
+    if row_cache is None:
+        return function(data)
+
+    result = row_cache.get(function)
+    if result is None:
+        result = row_cache[function] = function(data)
+
+    return result
+
+
+def compile_value_getter(data_path, value_function, fallback, prepare_function=None):
+    """
+    returns a function which extracts the raw metric value from the data.
+
+    If a 'prepare_function' is defined, the 'value_function' gets passed its result instead of
+    the data. This way metrics of the same row can share expensive parsing of the row data.
+    """
+
+    if value_function is not None:
+        def get_value(data, row_cache=None):
+            # noinspection PyBroadException
+            try:
+                if prepare_function is not None:
+                    data = get_row_result(prepare_function, data, row_cache)
+
+                return value_function(data)
+            except Exception:
+                return None
+
+        return get_value
+
+    path = compile_path(data_path)
+
+    return lambda data, row_cache=None: path.get(data, fallback)
+
+
+def compile_exclude_filter(exclude_filter_function):
+    """
+    returns a function which returns True if the data should be excluded, or None if there is no filter
+    """
+
+    if exclude_filter_function is None:
+        return None
+
+    def exclude(data):
+        # noinspection PyBroadException
+        try:
+            return exclude_filter_function(data) is True
+        except Exception:
+            return False
+
+    return exclude
+
+
+def compile_tags_getter(data_tags, tags_function):
+    """
+    returns a function which returns the tags of a measurement
+    """
+
+    static_tags = data_tags if isinstance(data_tags, dict) else dict()
+
+    if tags_function is None:
+        return lambda data, row_cache=None: static_tags
+
+    def get_tags(data, row_cache=None):
+        # noinspection PyBroadException
+        try:
+            return {**static_tags, **get_row_result(tags_function, data, row_cache)}
+        except Exception:
+            return static_tags
+
+    return get_tags
+
+
+def compile_step(service_name, metric_name, metric_params):
+    """
+    compile the definition of a metric (or the 'next' definition of a list or dict metric)
+    into a function which extracts the measurements from the data.
+
+    Parameters
+    ----------
+    service_name: str
+        name of the service, used for logging
+    metric_name: str
+        name of the metric
+    metric_params: dict
+        the metric definition
+
+    Returns
+    -------
+    callable: function to call with the data and an ExtractionContext, or None if the definition is invalid
+    """
+
+    data_path = metric_params.get("data_path")
+    data_type = metric_params.get("type")
+    data_next = metric_params.get("next")
+    value_function = metric_params.get("value_function")
+    timestamp_function = metric_params.get("timestamp_function")            # needs to return a datetime
+
+    if data_path is not None and value_function is not None:
+        log.error("Attributes 'data_path' and 'value_function' cant be defined for the same entry"
+                  f"at the same time: {metric_params}")
+        return None
+
+    exclude = compile_exclude_filter(metric_params.get("exclude_filter_function"))  # needs to return a bool
+    get_value = compile_value_getter(data_path, value_function, "" if data_type is str else None,
+                                     metric_params.get("prepare_function"))
+
+    if data_type in scalar_types:
+
+        get_tags = compile_tags_getter(metric_params.get("tags"), metric_params.get("tags_function"))
+
+        def extract_scalar(data, context):
+
+            if exclude is not None and exclude(data) is True:
+                return
+
+            metric_value = get_value(data, context.row_cache)
+            metric_tags = get_tags(data, context.row_cache)
+
+            timestamp = None
+            if timestamp_function is not None:
+                timestamp = context.get_timestamp(timestamp_function, data)
+
+            if timestamp is None:
+                timestamp = context.timestamp
+
+            if metric_value is None:
+                log.error(f"Unable to extract '{metric_name}' form '{data}', got '{type(metric_value)}'")
+                return
+
+            try:
+                metric_value = data_type(metric_value)
+            except Exception as e:
+                log.error(f"Unable to convert {service_name} value '{metric_value}' "
+                          f"for '{metric_name}' to '{data_type}': {e}")
+
+            context.add_measurement(FritzMeasurement(metric_name, metric_value, data_type=data_type,
+                                                     box_tag=context.box_tag, additional_tags=metric_tags,
+                                                     timestamp=timestamp))
+
+        return extract_scalar
+
+    next_step = None
+    next_timestamp_function = None
+    if data_type in (list, dict) and data_next is not None:
+        next_step = compile_step(service_name, metric_name, data_next)
+        next_timestamp_function = data_next.get("timestamp_function")
+
+    def extract_container(data, context):
+
+        if exclude is not None and exclude(data) is True:
+            return
+
+        metric_value = get_value(data)
+
+        if metric_value is None:
+            log.error(f"Unable to extract '{metric_name}' form '{data}', got '{type(metric_value)}'")
+            return
+
+        if matches_container_type(metric_value, data_type) is False:
+            log.error(f"FritzBox metric type '{data_type}' for '{metric_name}' "
+                      f"does not match '{type(metric_value)}' data: {metric_value}")
+            return
+
+        if data_next is None:
+            log.error(f"Unknown metric '{data_path}' form '{data}', with type '{type(metric_value)}' "
+                      f"and defined type '{data_type}'")
+            return
+
+        if next_step is None:
+            return
+
+        if data_type == dict:
+            for next_metric_value in metric_value.values():
+                next_step(next_metric_value, context)
+
+            return
+
+        high_water_mark = context.high_water_mark
+        if high_water_mark is None or next_timestamp_function is None:
+            for next_metric_value in metric_value:
+                next_step(next_metric_value, context)
+
+            return
+
+        for next_metric_value in metric_value:
+
+            # entries are returned newest first, all following entries have been handled already
+            next_timestamp = context.get_timestamp(next_timestamp_function, next_metric_value)
+            if next_timestamp is not None and next_timestamp.timestamp() < high_water_mark:
+                break
+
+            next_step(next_metric_value, context)
+
+    return extract_container
+
+
+def get_group_key(metric_params):
+    """
+    returns the key to group this metric with other metrics reading the rows of the same list or dict,
+    or None if the metric can't be grouped
+    """
+
+    data_path = metric_params.get("data_path")
+    data_type = metric_params.get("type")
+    data_next = metric_params.get("next")
+
+    if data_path is None or metric_params.get("value_function") is not None or data_type not in (list, dict):
+        return None
+
+    # only rows which result in single measurements can share the row cache
+    if not isinstance(data_next, dict) or data_next.get("type") not in scalar_types:
+        return None
+
+    return data_path, data_type
+
+
+def compile_group_step(service_name, data_path, data_type, metrics):
+    """
+    compile list or dict metrics which share the same 'data_path' into a single function.
+    The rows are only walked once, and all metrics of a row share the results of the tags and prepare functions.
+
+    Parameters
+    ----------
+    service_name: str
+        name of the service, used for logging
+    data_path: str
+        the data path of all metrics
+    data_type: type
+        list or dict
+    metrics: list
+        list of tuples with metric name and metric definition
+
+    Returns
+    -------
+    callable: function to call with the data and an ExtractionContext
+    """
+
+    path = compile_path(data_path)
+
+    # metric name, exclude filter, step for each row, timestamp function of a row
+    members = list()
+    for metric_name, metric_params in metrics:
+        next_step = compile_step(service_name, metric_name, metric_params.get("next"))
+        if next_step is None:
+            continue
+
+        members.append((metric_name, compile_exclude_filter(metric_params.get("exclude_filter_function")),
+                        next_step, metric_params.get("next").get("timestamp_function")))
+
+    def is_handled(timestamp_function, row, context):
+        """
+        entries are returned newest first, all following entries have been handled already
+        """
+
+        if timestamp_function is None:
+            return False
+
+        timestamp = context.get_timestamp(timestamp_function, row)
+
+        return timestamp is not None and timestamp.timestamp() < context.high_water_mark
+
+    def extract_group(data, context):
+
+        active_members = [(metric_name, next_step, timestamp_function)
+                          for metric_name, exclude, next_step, timestamp_function in members
+                          if exclude is None or exclude(data) is False]
+
+        if len(active_members) == 0:
+            return
+
+        metric_value = path.get(data)
+
+        if metric_value is None:
+            for metric_name, _, _ in active_members:
+                log.error(f"Unable to extract '{metric_name}' form '{data}', got '{type(metric_value)}'")
+            return
+
+        if matches_container_type(metric_value, data_type) is False:
+            for metric_name, _, _ in active_members:
+                log.error(f"FritzBox metric type '{data_type}' for '{metric_name}' "
+                          f"does not match '{type(metric_value)}' data: {metric_value}")
+            return
+
+        rows = metric_value.values() if data_type == dict else metric_value
+        check_high_water_mark = data_type == list and context.high_water_mark is not None
+
+        try:
+            for row in rows:
+
+                if check_high_water_mark is True:
+                    active_members = [member for member in active_members
+                                      if is_handled(member[2], row, context) is False]
+                    if len(active_members) == 0:
+                        break
+
+                context.row_cache = dict()
+                for _, next_step, _ in active_members:
+                    next_step(row, context)
+        finally:
+            context.row_cache = None
+
+    return extract_group
+
+
+class ExtractionPlan:
+    """
+        The value_instances of a Lua service compiled once into a list of extraction steps.
+
+        Each step is a closure with the paths already split, the filter and tags functions
+        wrapped and the type conversion resolved, so extracting the measurements of a
+        response doesn't need to look at the metric definitions again.
+
+        List and dict metrics with the same 'data_path' are compiled into a single step,
+        which walks the rows only once for all of these metrics.
+    """
+
+    def __init__(self, service_name, value_instances):
+        """
+        Parameters
+        ----------
+        service_name: str
+            name of the service, used for logging
+        value_instances: dict
+            the metric definitions of the service
+        """
+
+        self.steps = list()
+
+        groups = dict()
+        for metric_name, metric_params in value_instances.items():
+            groups.setdefault(get_group_key(metric_params) or metric_name, list()).append((metric_name, metric_params))
+
+        for group_key, metrics in groups.items():
+
+            if len(metrics) > 1:
+                step = compile_group_step(service_name, *group_key, metrics)
+            else:
+                step = compile_step(service_name, *metrics[0])
+
+            if step is not None:
+                self.steps.append(step)
+
+    def extract(self, data, context):
+        """
+        extract all measurements from the data and add them to the context result list
+        """
+
+        for step in self.steps:
+            step(data, context)
+
+        return context.result_list
+
+# EOF
@@ -8,6 +8,7 @@
 #  repository or visit: <https://opensource.org/licenses/MIT>.
 
 import asyncio
+from functools import partial
 
 import urllib3
 import requests
@@ -21,10 +22,13 @@ from fritzconnection.core.exceptions import FritzConnectionException, FritzServi
 from fritzinfluxdb.classes.fritzbox.config import FritzBoxConfig
 from fritzinfluxdb.log import get_logger
 from fritzinfluxdb.classes.fritzbox.service_handler import FritzBoxTR069Service, FritzBoxLuaService
+from fritzinfluxdb.classes.fritzbox.extraction_plan import ExtractionContext
 import fritzinfluxdb.classes.fritzbox.service_definitions as service_definitions
 from fritzinfluxdb.classes.common import FritzMeasurement
-from fritzinfluxdb.common import grab
+from fritzinfluxdb.common import localize
 from fritzinfluxdb.classes.fritzbox.model import FritzBoxModel
+from fritzinfluxdb.classes.scheduler import ServiceScheduler
+from fritzinfluxdb.classes.state_file import StateFile
 
 log = get_logger()
 
@@ -48,7 +52,7 @@ class FritzBoxHandlerBase:
 
         self.init_successful = False
         self.services = list()
-        self.current_result_list = list()
+        self.request_semaphore = None
 
         self.version = None
 
@@ -73,9 +77,45 @@ class FritzBoxHandlerBase:
 
             self.services.append(new_service)
 
-    def query_service_data(self, _):
+    @staticmethod
+    async def run_blocking(func, *args, **kwargs):
+        """
+        run a blocking function in the default thread pool executor. This way a slow
+        FritzBox response doesn't stall the event loop and all other handlers keep running.
+        """
+
+        return await asyncio.get_running_loop().run_in_executor(None, partial(func, *args, **kwargs))
+
+    async def query_service_data(self, _):
         # stub for the default function
-        pass
+        return list()
+
+    async def query_service_data_limited(self, service):
+        """
+        query a service but only run as many service queries in parallel as defined in 'max_concurrent_requests'
+        """
+
+        async with self.request_semaphore:
+            return await self.query_service_data(service)
+
+    async def query_services(self, services, queue):
+        """
+        query all given services at once and write the results to the queue in order of the service list
+
+        Parameters
+        ----------
+        services: list
+            list of services to query
+        queue: asyncio.Queue
+            the result queue object to write measurements to
+        """
+
+        service_results = await asyncio.gather(*[self.query_service_data_limited(x) for x in services])
+
+        for result_list in service_results:
+            for result in result_list or list():
+                log.debug(result)
+                await queue.put(result)
 
     async def task_loop(self, queue):
         """
@@ -87,20 +127,38 @@ class FritzBoxHandlerBase:
             the result queue object to write measurements to so the influx handler can pick them up
 
         """
+
+        self.request_semaphore = asyncio.Semaphore(self.config.max_concurrent_requests)
+
+        # first discovery run, all services are queried once
+        await self.query_services(self.services, queue)
+        self.discovery_done = True
+
+        # spread the services across their interval to avoid request bursts
+        scheduler = ServiceScheduler(jitter=self.config.request_jitter)
+        available_services = [x for x in self.services if x.available is True]
+        for index, service in enumerate(available_services):
+            scheduler.add(service, service.interval, delay=self.config.request_interval,
+                          phase_key=f"{self.config.box_tag}/{self.name}", slot=index / len(available_services))
+
         while True:
 
-            self.current_result_list = list()
-            for service in self.services:
-                self.query_service_data(service)
+            scheduled_services = await scheduler.wait_for_due_items()
 
-            for result in self.current_result_list:
-                log.debug(result)
-                await queue.put(result)
+            last_queries = [x.item.last_query for x in scheduled_services]
+
+            await self.query_services([x.item for x in scheduled_services], queue)
 
-            await asyncio.sleep(1)
+            for scheduled_service, last_query in zip(scheduled_services, last_queries):
 
-            # first discovery run is done
-            self.discovery_done = True
+                if scheduled_service.item.available is False:
+                    continue
+
+                # the service query was unsuccessful, try again after the request interval
+                if scheduled_service.item.last_query == last_query:
+                    scheduler.reschedule(scheduled_service, retry_in=self.config.request_interval)
+                else:
+                    scheduler.reschedule(scheduled_service)
 
 
 class FritzBoxHandler(FritzBoxHandlerBase):
@@ -173,7 +231,7 @@ class FritzBoxHandler(FritzBoxHandlerBase):
         if self.init_successful is True:
             log.info(f"Closed {self.name} connection")
 
-    def query_service_data(self, service):
+    async def query_service_data(self, service):
 
         def service_invalid_log(log_message):
             if service.link_type is not None and service.link_type is not self.config.link_type:
@@ -184,12 +242,11 @@ class FritzBoxHandler(FritzBoxHandlerBase):
 
             log_handler(log_message)
 
+        result_list = list()
+
         if not isinstance(service, FritzBoxTR069Service):
             log.error("Query service must be of type 'FritzBoxTR069Service'")
-            return
-
-        if self.discovery_done is True and service.should_be_requested() is False:
-            return
+            return result_list
 
         # Request every action
         for action in service.actions:
@@ -203,7 +260,8 @@ class FritzBoxHandler(FritzBoxHandlerBase):
 
             # add parameters
             try:
-                call_result = self.session.call_action(service.name, action.name, **action.params)
+                call_result = await self.run_blocking(self.session.call_action, service.name, action.name,
+                                                      **action.params)
             except FritzServiceError:
                 service_invalid_log(f"Requested invalid service: {service.name}")
                 if self.discovery_done is False:
@@ -265,7 +323,7 @@ class FritzBoxHandler(FritzBoxHandlerBase):
                             log.warning(f"Unknown data type '{metric_data_type}' for metric '{key}' "
                                         f"in service '{service.name}'")
 
-                    self.current_result_list.append(
+                    result_list.append(
                         FritzMeasurement(metric_name, value, box_tag=self.config.box_tag, data_type=data_type)
                     )
 
@@ -278,7 +336,7 @@ class FritzBoxHandler(FritzBoxHandlerBase):
                 service_invalid_log(f"All actions for service '{service.name}' are unavailable. Disabling service.")
                 service.available = False
 
-        return
+        return result_list
 
 
 class FritzBoxLuaHandler(FritzBoxHandlerBase):
@@ -304,8 +362,43 @@ class FritzBoxLuaHandler(FritzBoxHandlerBase):
         self.session = requests.Session()
         self.session.verify = self.config.verify_tls
 
+        # keep enough connections alive to serve all concurrent requests
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.config.max_concurrent_requests)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.login_lock = None
+
         self.add_services(FritzBoxLuaService, service_definitions.lua_services)
 
+        # restore tracked measurements to avoid reporting them again after a restart
+        self.state_file = None
+        if self.config.state_file is not None:
+            self.state_file = StateFile(self.config.state_file)
+            self.state_file.load()
+
+            for service in self.services:
+                if service.track_measurements is True and \
+                        service.tracked_measurements.restore_state(self.state_file.get(service.state_key)) is True:
+                    log.debug(f"Restored tracked measurements state for {self.name} service '{service.name}'")
+
+    async def save_tracked_measurements_state(self, service):
+        """
+        write the state of tracked measurements of a service to the state file if it has changed
+        """
+
+        if self.state_file is None or service.track_measurements is False:
+            return
+
+        state = service.tracked_measurements.get_state()
+
+        if state is None or self.state_file.set(service.state_key, state) is False:
+            return
+
+        snapshot = self.state_file.snapshot()
+        if snapshot is not None:
+            await self.run_blocking(self.state_file.write, *snapshot)
+
     def connect(self):
 
         if self.sid is not None:
@@ -367,10 +460,15 @@ class FritzBoxLuaHandler(FritzBoxHandlerBase):
         self.sid = sid
         self.init_successful = True
 
-    def request(self, service_to_request, additional_params):
+    async def request(self, service_to_request, additional_params):
+
+        # make sure concurrent requests don't all try to log in at the same time
+        if self.login_lock is None:
+            self.login_lock = asyncio.Lock()
 
         if self.sid is None:
-            self.connect()
+            async with self.login_lock:
+                await self.run_blocking(self.connect)
 
         params = {
             "sid": self.sid
@@ -394,14 +492,16 @@ class FritzBoxLuaHandler(FritzBoxHandlerBase):
 
         # perform request
         try:
-            response = self.session.request(service_to_request.method, data_url, **call_attributes)
+            response = await self.run_blocking(self.session.request, service_to_request.method, data_url,
+                                               **call_attributes)
         except Exception as e:
             log.error(f"Unable to perform request to '{data_url}': {e}")
             return
 
-        # check for invalid session
+        # check for invalid session, unless a concurrent request already logged in again
         if "<html" in f"{response.content}"[0:100]:
-            self.sid = None
+            if self.sid == params.get("sid"):
+                self.sid = None
             return
 
         # noinspection PyBroadException
@@ -422,7 +522,7 @@ class FritzBoxLuaHandler(FritzBoxHandlerBase):
             log.error(f"{self.name} returned body: {result}")
 
             # invalidate session
-            if response.status_code in [303, 403]:
+            if response.status_code in [303, 403] and self.sid == params.get("sid"):
                 self.sid = None
 
         return result
@@ -432,55 +532,10 @@ class FritzBoxLuaHandler(FritzBoxHandlerBase):
         if self.init_successful is True:
             log.info(f"Closed {self.name} connection")
 
-    def extract_value(self, service, data, metric_name, metric_params):
-
-        # read config
-        data_path = metric_params.get("data_path")
-        data_type = metric_params.get("type")
-        data_next = metric_params.get("next")
-        data_tags = metric_params.get("tags")
-        value_function = metric_params.get("value_function")
-        tags_function = metric_params.get("tags_function")                      # needs to return a dict
-        timestamp_function = metric_params.get("timestamp_function")            # needs to return a datetime
-        exclude_filter_function = metric_params.get("exclude_filter_function")  # needs to return a bool
-
-        # define defaults
-        metric_value = None
-        timestamp = None
-        metric_tags = dict()
-
-        # noinspection PyBroadException
-        try:
-            if exclude_filter_function(data) is True:
-                return
-        except Exception:
-            pass
-
-        if data_path is not None and value_function is not None:
-            log.error("Attributes 'data_path' and 'value_function' cant be defined for the same entry"
-                      f"at the same time: {metric_params}")
-            return
-
-        # first we try to use the value_function
-        if value_function is not None:
-            # noinspection PyBroadException
-            try:
-                metric_value = value_function(data)
-            except Exception:
-                pass
-
-        elif data_path is not None:
-            metric_value = grab(data, data_path, fallback="" if data_type is str else None)
-
-        # try to add tags
-        if isinstance(data_tags, dict):
-            metric_tags = data_tags
-
-        # noinspection PyBroadException
-        try:
-            metric_tags = {**metric_tags, **tags_function(data)}
-        except Exception:
-            pass
+    def get_timestamp(self, timestamp_function, data):
+        """
+        returns the time zone aware timestamp returned by 'timestamp_function' or None if this fails
+        """
 
         # noinspection PyBroadException
         try:
@@ -488,63 +543,20 @@ class FritzBoxLuaHandler(FritzBoxHandlerBase):
 
             # make timestamp time zone aware if time zone is missing
             if timestamp.tzinfo is None or timestamp.tzinfo.utcoffset(timestamp) is None:
-                timestamp = self.config.timezone.localize(timestamp)
+                timestamp = localize(self.config.timezone, timestamp)
 
         except Exception:
-            pass
+            return None
 
-        if metric_value is None:
-            log.error(f"Unable to extract '{metric_name}' form '{data}', got '{type(metric_value)}'")
-            return
-
-        if data_type in [int, float, bool, str]:
-            try:
-                metric_value = data_type(metric_value)
-            except Exception as e:
-                log.error(f"Unable to convert {self.name} value '{metric_value}' "
-                          f"for '{metric_name}' to '{data_type}': {e}")
-
-            metric = FritzMeasurement(metric_name, metric_value, data_type=data_type, box_tag=self.config.box_tag,
-                                      additional_tags=metric_tags, timestamp=timestamp)
-
-            # check if measurement is tracked and already reported
-            if service.skip_tracked_measurement(metric) is True:
-                return
+        return timestamp
 
-            # track measurement (if configured)
-            service.add_tracked_measurement(metric)
+    async def query_service_data(self, service):
 
-            self.current_result_list.append(metric)
-            return
-
-        if type(metric_value) != data_type:
-            log.error(f"FritzBox metric type '{data_type}' for '{metric_name}' "
-                      f"does not match '{type(metric_value)}' data: {metric_value}")
-            return
-
-        if data_type == list and data_next is not None:
-            for next_metric_value in metric_value:
-                self.extract_value(service, next_metric_value, metric_name, data_next)
-
-            return
-
-        if data_type == dict and data_next is not None:
-            for next_metric_value in metric_value.values():
-                self.extract_value(service, next_metric_value, metric_name, data_next)
-
-            return
-
-        log.error(f"Unknown metric '{data_path}' form '{data}', with type '{type(metric_value)}' "
-                  f"and defined type '{data_type}'")
-
-    def query_service_data(self, service):
+        result_list = list()
 
         if not isinstance(service, FritzBoxLuaService):
             log.error("Query service must be of type 'FritzBoxLuaService'")
-            return
-
-        if self.discovery_done is True and service.should_be_requested() is False:
-            return
+            return result_list
 
         service_and_version_name = f"{service.name} " \
                                    f"(Fritz!OS {service.os_min_versions} - {service.os_max_versions or 'latest'})"
@@ -554,16 +566,16 @@ class FritzBoxLuaHandler(FritzBoxHandlerBase):
                           f"supported versions for '{service.name}': "
                           f"{service.os_min_versions} - {service.os_max_versions or 'latest'}")
                 service.available = False
-                return
+                return result_list
 
             if service.link_type is not None and self.config.link_type != service.link_type:
                 log.info(f"Service '{service_and_version_name}' not applicable for this "
                          f"FritzBox Model Link type '{self.config.link_type}'")
                 service.available = False
-                return
+                return result_list
 
         # request data
-        result = self.request(service, additional_params=service.params)
+        result = await self.request(service, additional_params=service.params)
 
         if result is None:
             message_handler = log.info
@@ -579,15 +591,22 @@ class FritzBoxLuaHandler(FritzBoxHandlerBase):
             if self.discovery_done is False:
                 log.info(f"{self.name} service '{service_and_version_name}' will be disabled.")
                 service.available = False
-            return
+            return result_list
 
         log.debug(f"Request {self.name} service '{service_and_version_name}' returned successfully")
 
         # set time stamp of this query
         service.set_last_query_now()
 
-        # Request every param
-        for metric_name, metric_params in service.value_instances.items():
-            self.extract_value(service, result, metric_name, metric_params)
+        # with incremental services only entries newer than the last request are extracted
+        high_water_mark = service.get_high_water_mark()
+
+        # extract every metric
+        service.extraction_plan.extract(result, ExtractionContext(service, self.config.box_tag, self.get_timestamp,
+                                                                  high_water_mark, result_list))
+
+        service.report_future_entries()
+        service.evict_tracked_measurements()
+        await self.save_tracked_measurements_state(service)
 
-        return
+        return result_list
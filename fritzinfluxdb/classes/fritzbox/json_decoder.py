@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+"""
+    Shared JSON decoder for FritzBox responses. Uses 'orjson' if it is installed,
+    otherwise the json module of the standard library.
+"""
+
+import json
+
+# optional fast JSON decoder
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from fritzinfluxdb.log import get_logger
+
+log = get_logger()
+
+# function to decode the raw response bytes, can be replaced to plug in a different decoder
+json_loads = orjson.loads if orjson is not None else json.loads
+
+
+def prepare_json_response_data(response):
+    """
+    handler to prepare returned json data for parsing. The raw response bytes are decoded directly,
+    if this fails the response is decoded by 'requests' which also handles unusual character sets.
+
+    Parameters
+    ----------
+    response: requests.response
+        the FritzBox request response
+
+    Return
+    ------
+    dict: the decoded JSON data
+    """
+
+    try:
+        return json_loads(response.content)
+    except ValueError as e:
+        log.debug(f"Decoding JSON response from raw bytes failed, trying again with declared encoding: {e}")
+
+    return response.json()
+
+# EOF
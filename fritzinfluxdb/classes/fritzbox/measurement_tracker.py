@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import hashlib
+import time
+
+from fritzinfluxdb.classes.common import FritzMeasurement
+
+
+def stable_digest(measurement: FritzMeasurement):
+    """
+    returns a digest of the measurement which, unlike hash(), stays the same across restarts
+    """
+
+    timestamp = measurement.timestamp
+
+    data = "\0".join([
+        measurement.name,
+        type(measurement.value).__name__,
+        f"{measurement.value}",
+        f"{int(timestamp.timestamp())}.{timestamp.microsecond:06d}",
+        *[f"{key}={value}" for key, value in sorted(measurement.tags.items())]
+    ])
+
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class MeasurementTracker:
+    """
+        Keeps track of measurements which have already been reported, i.e. log entries
+        which are returned by the FritzBox with every request.
+
+        Only measurements within a time window (horizon) relative to the newest tracked
+        measurement are remembered. Once tracked measurements have been evicted, every
+        measurement older than the window is considered as already reported. This way
+        memory stays flat and old entries are never reported twice.
+
+        The window is based on the timestamps of the measurements and not on the local
+        clock, so a FritzBox with a wrong clock doesn't cause any trouble. Only timestamps
+        ahead of the local clock are limited to the local time (plus 'max_clock_skew'). This
+        way a single entry dated in the future can't move the window and hide all other entries.
+
+        To survive restarts, the state of the tracker can be exported and restored. It consists
+        of the newest timestamp (high-water mark) and stable digests of all measurements with
+        exactly this timestamp. After a restore, every measurement older than the high-water
+        mark is considered as already reported.
+    """
+
+    # number of seconds the timestamp of a measurement may be ahead of the local clock
+    max_clock_skew = 60
+
+    def __init__(self, horizon):
+        """
+        Parameters
+        ----------
+        horizon: int
+            time window in seconds to keep track of measurements
+        """
+
+        self.horizon = horizon
+
+        self.newest_timestamp = None
+        self.oldest_tracked_timestamp = None
+        self.restored_timestamp = None
+
+        # measurement hash -> measurement timestamp
+        self._tracked = dict()
+
+        # stable digest -> timestamp of measurements with the newest (or a future) timestamp
+        self._newest_digests = dict()
+        self._restored_digests = set()
+
+    def __len__(self):
+        return len(self._tracked)
+
+    def __contains__(self, measurement: FritzMeasurement):
+
+        timestamp = measurement.timestamp.timestamp()
+
+        if self.oldest_tracked_timestamp is not None and timestamp < self.oldest_tracked_timestamp:
+            return True
+
+        if self.restored_timestamp is not None and timestamp >= self.restored_timestamp and \
+                stable_digest(measurement) in self._restored_digests:
+            return True
+
+        return hash(measurement) in self._tracked
+
+    def add(self, measurement: FritzMeasurement):
+
+        timestamp = measurement.timestamp.timestamp()
+
+        self._tracked[hash(measurement)] = timestamp
+
+        # timestamps ahead of the local clock don't move the window any further
+        window_timestamp = min(timestamp, time.time() + self.max_clock_skew)
+
+        if self.newest_timestamp is None or window_timestamp > self.newest_timestamp:
+            self.newest_timestamp = window_timestamp
+            self._newest_digests = {digest: digest_timestamp for digest, digest_timestamp
+                                    in self._newest_digests.items() if digest_timestamp >= window_timestamp}
+
+        if timestamp >= self.newest_timestamp:
+            self._newest_digests[stable_digest(measurement)] = timestamp
+
+    def evict(self):
+        """
+        forget all measurements which are older than the horizon. Needs to be called
+        after all measurements of a request have been handled.
+        """
+
+        if self.newest_timestamp is None:
+            return
+
+        self.oldest_tracked_timestamp = self.newest_timestamp - self.horizon
+
+        # everything before the restored high-water mark has been reported before the restart
+        if self.restored_timestamp is not None and self.restored_timestamp > self.oldest_tracked_timestamp:
+            self.oldest_tracked_timestamp = self.restored_timestamp
+
+        if min(self._tracked.values(), default=self.oldest_tracked_timestamp) >= self.oldest_tracked_timestamp:
+            return
+
+        self._tracked = {measurement_hash: timestamp for measurement_hash, timestamp in self._tracked.items()
+                         if timestamp >= self.oldest_tracked_timestamp}
+
+    def get_state(self):
+        """
+        returns the state of the tracker which can be restored with 'restore_state'
+
+        Returns
+        -------
+        dict: the tracker state or None if nothing has been tracked yet
+        """
+
+        if self.newest_timestamp is None:
+            return None
+
+        return {
+            "timestamp": self.newest_timestamp,
+            "digests": sorted(self._newest_digests)
+        }
+
+    def restore_state(self, state):
+        """
+        restore a tracker state which has been returned by 'get_state'
+
+        Parameters
+        ----------
+        state: dict
+            the tracker state
+
+        Returns
+        -------
+        bool: True if the state has been restored
+        """
+
+        if not isinstance(state, dict):
+            return False
+
+        timestamp = state.get("timestamp")
+        digests = state.get("digests")
+
+        if not isinstance(timestamp, (int, float)) or not isinstance(digests, list):
+            return False
+
+        self.newest_timestamp = self.restored_timestamp = self.oldest_tracked_timestamp = float(timestamp)
+        self._newest_digests = {digest: self.newest_timestamp for digest in digests}
+        self._restored_digests = set(digests)
+
+        return True
+
+# EOF
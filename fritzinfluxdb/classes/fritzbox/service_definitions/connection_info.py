@@ -8,18 +8,11 @@
 #  repository or visit: <https://opensource.org/licenses/MIT>.
 
 from fritzinfluxdb.common import grab
+from fritzinfluxdb.classes.fritzbox.json_decoder import prepare_json_response_data
 from fritzinfluxdb.classes.fritzbox.service_definitions import lua_services
 from fritzinfluxdb.classes.fritzbox.model import FritzBoxLinkTypes
 
 
-def prepare_json_response_data(response):
-    """
-    handler to prepare returned json data for parsing
-    """
-
-    return response.json()
-
-
 lua_services.append({
         "name": "DSL Info",
         "os_min_versions": "7.29",
@@ -12,14 +12,18 @@
     https://avm.de/fileadmin/user_upload/Global/Service/Schnittstellen/AHA-HTTP-Interface.pdf
 """
 
-import xmltodict
 import random
 from datetime import datetime
+from io import BytesIO
+from xml.etree import ElementTree
 
-from fritzinfluxdb.common import grab, in_test_mode
+from fritzinfluxdb.common import grab, compile_path, in_test_mode
+from fritzinfluxdb.log import get_logger
 from fritzinfluxdb.classes.fritzbox.service_handler import FritzBoxLuaURLPath
 from fritzinfluxdb.classes.fritzbox.service_definitions import lua_services
 
+log = get_logger()
+
 home_automation_device_classes = {
     0:  "HAN-FUN",
     1:  "UNDEFINED 1",
@@ -77,6 +81,12 @@ hun_fun_interface_types = {
     "1024": "SUOTA-Update"
 }
 
+temperature_celsius_path = compile_path("temperature.celsius")
+temperature_offset_path = compile_path("temperature.offset")
+powermeter_power_path = compile_path("powermeter.power")
+powermeter_energy_path = compile_path("powermeter.energy")
+powermeter_voltage_path = compile_path("powermeter.voltage")
+
 test_data = None
 test_file_location = "test/homeauto_sample.xml"
 test_start_ts = datetime.now().timestamp()
@@ -104,7 +114,7 @@ def get_ha_temperature(data):
     if in_test_mode():
         return random.randrange(220, 250) / 10
 
-    return float((int(grab(data, "temperature.celsius")) + int(grab(data, "temperature.offset")))/10)
+    return float((int(temperature_celsius_path.get(data)) + int(temperature_offset_path.get(data)))/10)
 
 
 def get_ha_powermeter_power(data):
@@ -112,12 +122,12 @@ def get_ha_powermeter_power(data):
     if in_test_mode():
         return random.randrange(300_000, 500_000) / 1000
 
-    return float(int(grab(data, "powermeter.power")) / 1000)
+    return float(int(powermeter_power_path.get(data)) / 1000)
 
 
 def get_ha_powermeter_energy(data):
 
-    energy = grab(data, "powermeter.energy")
+    energy = powermeter_energy_path.get(data)
     if in_test_mode():
         return float(energy) + float(datetime.now().timestamp() - test_start_ts)
 
@@ -129,7 +139,7 @@ def get_ha_powermeter_voltage(data):
     if in_test_mode():
         return random.randrange(225_000, 234_000) / 1000
 
-    return float(int(grab(data, "powermeter.voltage")) / 1000)
+    return float(int(powermeter_voltage_path.get(data)) / 1000)
 
 
 def get_ha_switch_state(data):
@@ -148,6 +158,10 @@ def get_ha_alert_state(data):
     return "0"+grab(data, "alert.state", fallback="0")
 
 
+def get_device_tags(data):
+    return {"name": data.get("name")}
+
+
 def decode_function_bitmask(bitmask: int):
 
     return_values = list()
@@ -165,43 +179,160 @@ def decode_function_bitmask(bitmask: int):
     return return_values
 
 
-def reformat_homeauto_device_list(data):
+def xml_element_to_dict(element):
+    """
+    convert a XML element to a dict the same way xmltodict does. Attributes are prefixed with '@',
+    repeated child elements become a list and elements without attributes or children become a string.
+    """
+
+    result = {f"@{key}": value for key, value in element.attrib.items()}
+
+    for child in element:
+        value = xml_element_to_dict(child)
+
+        if child.tag not in result:
+            result[child.tag] = value
+        elif isinstance(result[child.tag], list):
+            result[child.tag].append(value)
+        else:
+            result[child.tag] = [result[child.tag], value]
+
+    text = element.text.strip() if element.text is not None else ""
+
+    if len(text) > 0:
+        if len(result) == 0:
+            return text
+        result["#text"] = text
+
+    return result if len(result) > 0 else None
+
+
+class HomeAutoDeviceList:
+    """
+        Iterates over the devices of a 'getdevicelistinfos' response.
+
+        The XML document is parsed incrementally and only a single device is converted to a dict
+        at a time. HAN-FUN devices are skipped, only their firmware version is kept for their
+        HAN-FUN units. If a unit is listed before its HAN-FUN device, the unit is held back
+        until the device has been read.
+
+        Every iteration parses the document again and no devices are kept. All 'devicelist.device'
+        metrics are compiled into a single group step of the ExtractionPlan, this way the list
+        is only iterated once per response.
+    """
+
+    root_tag = "devicelist"
+    device_tag = "device"
+
+    # these need to be skipped and only scraped for the @fwversion
+    hun_fun_device_class = home_automation_device_classes[0]
+    hun_fun_unit_class = home_automation_device_classes[13]   # these ones are kept
+
+    def __init__(self, content):
+        """
+        Parameters
+        ----------
+        content: bytes
+            the XML document
+
+        Raises
+        ------
+        ValueError: if the document is not a device list
+        ElementTree.ParseError: if the document is not valid XML
+        """
+
+        self.content = content
+
+        _, root = next(ElementTree.iterparse(BytesIO(content), events=("start",)))
+        if root.tag != self.root_tag:
+            raise ValueError(f"expected XML element '{self.root_tag}', got '{root.tag}'")
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({len(self.content)} bytes)"
+
+    def iter_devices(self):
+        """
+        yields every device of the list as dict
+        """
+
+        depth = 0
+        root = None
+
+        try:
+            for event, element in ElementTree.iterparse(BytesIO(self.content), events=("start", "end")):
+
+                if event == "start":
+                    if root is None:
+                        root = element
+                    depth += 1
+                    continue
+
+                depth -= 1
+
+                # only direct children of the root element are handled
+                if depth != 1:
+                    continue
+
+                if element.tag == self.device_tag:
+                    yield xml_element_to_dict(element)
+
+                # release parsed elements
+                root.clear()
+
+        except ElementTree.ParseError as e:
+            log.error(f"Parsing home automation device list failed: {e}")
+
+    def __iter__(self):
+
+        firmware_by_id = dict()
+        units_by_parent_id = dict()
+
+        for device in self.iter_devices():
+
+            device_functions = decode_function_bitmask(device.get("@functionbitmask"))
+
+            # add function list
+            device["@devicefunctions"] = device_functions
 
-    device_list = data.get("devicelist")
+            device_id = device.get("@id")
+            firmware_by_id[device_id] = device.get("@fwversion")
 
-    devices_by_id = {x.get("@id"): x for x in device_list.get("device", [])}
+            # units waiting for this device
+            for unit in units_by_parent_id.pop(device_id, list()):
+                self.set_parent_firmware(unit, device.get("@fwversion"))
+                yield unit
 
-    hun_fun_device_id = 0  # these need to be skipped and only scraped for the @fwversion
-    hun_fun_unit_id = 13   # these ones are kept
+            if self.hun_fun_unit_class in device_functions and self.hun_fun_device_class not in device_functions:
 
-    new_device_list = list()
-    for device in device_list.get("device", []):
+                etsi_unit_info = device.get("etsiunitinfo")
 
-        device_functions = decode_function_bitmask(device.get("@functionbitmask"))
+                parent_unit_id = grab(etsi_unit_info, "etsideviceid")
+                if parent_unit_id is None:
+                    continue
 
-        # add function list
-        device["@devicefunctions"] = device_functions
+                etsi_unit_info["unittype"] = hun_fun_unit_types.get(grab(etsi_unit_info, "unittype"), "")
+                etsi_unit_info["interfaces"] = hun_fun_unit_types.get(grab(etsi_unit_info, "interfaces"), "")
 
-        if home_automation_device_classes[hun_fun_device_id] in device_functions:
-            continue
+                if parent_unit_id not in firmware_by_id:
+                    units_by_parent_id.setdefault(parent_unit_id, list()).append(device)
+                    continue
 
-        if home_automation_device_classes[hun_fun_unit_id] in device_functions:
+                self.set_parent_firmware(device, firmware_by_id.get(parent_unit_id))
 
-            parent_unit_id = grab(device, "etsiunitinfo.etsideviceid")
-            if parent_unit_id is None:
+            if self.hun_fun_device_class in device_functions:
                 continue
 
-            device["etsiunitinfo"]["unittype"] = hun_fun_unit_types.get(grab(device, "etsiunitinfo.unittype"), "")
-            device["etsiunitinfo"]["interfaces"] = hun_fun_unit_types.get(grab(device, "etsiunitinfo.interfaces"), "")
+            yield device
 
-            hun_fun_device_fw = devices_by_id.get(parent_unit_id, dict()).get("@fwversion")
-            if hun_fun_device_fw is not None:
-                device["@fwversion"] = hun_fun_device_fw
+        # units without a parent device
+        for units in units_by_parent_id.values():
+            yield from units
 
-        new_device_list.append(device)
+    @staticmethod
+    def set_parent_firmware(device, firmware):
 
-    data["devicelist"]["device"] = new_device_list
-    return data
+        if firmware is not None:
+            device["@fwversion"] = firmware
 
 
 def prepare_response_data(response):
@@ -215,21 +346,21 @@ def prepare_response_data(response):
 
     Return
     ------
-    dict: xml response parsed to dict
+    dict: dict with a HomeAutoDeviceList which parses the devices while they are extracted
     """
 
     global test_data
 
     if in_test_mode():
         if test_data is None:
-            with open(test_file_location) as f:
+            with open(test_file_location, "rb") as f:
                 test_data = f.read()
 
         content = test_data
     else:
         content = response.content
 
-    return reformat_homeauto_device_list(xmltodict.parse(content, force_list=('device',)))
+    return {HomeAutoDeviceList.root_tag: {HomeAutoDeviceList.device_tag: HomeAutoDeviceList(content)}}
 
 
 lua_services.append(
@@ -250,7 +381,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": str,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "data_path": "@fwversion"
                 },
                 "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
@@ -261,7 +392,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": str,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "data_path": "@productname"
                 },
                 "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
@@ -272,7 +403,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": str,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "data_path": "@manufacturer"
                 },
                 "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
@@ -283,7 +414,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": str,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: ", ".join(data.get("@devicefunctions"))
                 },
                 "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
@@ -295,7 +426,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "data_path": "present"
                 },
                 "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
@@ -308,7 +439,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "data_path": "battery",
                     "exclude_filter_function": lambda data: "battery" not in data.keys()
                 },
@@ -320,7 +451,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "data_path": "batterylow",
                     "exclude_filter_function": lambda data: "batterylow" not in data.keys()
                 },
@@ -334,10 +465,10 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": float,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": get_ha_temperature,
                     "exclude_filter_function": lambda data: (
-                        grab(data, "temperature.celsius") is None or grab(data, "temperature.offset") is None
+                        temperature_celsius_path.get(data) is None or temperature_offset_path.get(data) is None
                     )
                 },
                 "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
@@ -348,11 +479,11 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": float,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: (
-                        float(int(grab(data, "temperature.celsius")) / 10)
+                        float(int(temperature_celsius_path.get(data)) / 10)
                     ),
-                    "exclude_filter_function": lambda data: grab(data, "temperature.celsius") is None
+                    "exclude_filter_function": lambda data: temperature_celsius_path.get(data) is None
                 },
                 "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
             },
@@ -362,11 +493,11 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": float,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: (
-                        float(int(grab(data, "temperature.offset")) / 10)
+                        float(int(temperature_offset_path.get(data)) / 10)
                     ),
-                    "exclude_filter_function": lambda data: grab(data, "temperature.offset") is None
+                    "exclude_filter_function": lambda data: temperature_offset_path.get(data) is None
                 },
                 "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
             },
@@ -378,9 +509,9 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": float,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": get_ha_powermeter_power,
-                    "exclude_filter_function": lambda data: grab(data, "powermeter.power") is None
+                    "exclude_filter_function": lambda data: powermeter_power_path.get(data) is None
                 },
                 "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
             },
@@ -390,9 +521,9 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": float,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": get_ha_powermeter_energy,
-                    "exclude_filter_function": lambda data: grab(data, "powermeter.energy") is None
+                    "exclude_filter_function": lambda data: powermeter_energy_path.get(data) is None
                 },
                 "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
             },
@@ -402,9 +533,9 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": float,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": get_ha_powermeter_voltage,
-                    "exclude_filter_function": lambda data: grab(data, "powermeter.voltage") is None
+                    "exclude_filter_function": lambda data: powermeter_voltage_path.get(data) is None
                 },
                 "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
             },
@@ -416,7 +547,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": get_ha_switch_state,
                     "exclude_filter_function": lambda data: "switch" not in data.keys()
                 },
@@ -428,7 +559,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": str,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: grab(data, "switch.mode", fallback=""),
                     "exclude_filter_function": lambda data: "switch" not in data.keys()
                 },
@@ -440,7 +571,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: "0" + grab(data, "switch.lock", fallback="0"),
                     "exclude_filter_function": lambda data: "switch" not in data.keys()
                 },
@@ -452,7 +583,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: "0" + grab(data, "switch.devicelock", fallback="0"),
                     "exclude_filter_function": lambda data: "switch" not in data.keys()
                 },
@@ -464,7 +595,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: "0" + grab(data, "simpleonoff.state", fallback="0"),
                     "exclude_filter_function": lambda data: "simpleonoff" not in data.keys()
                 },
@@ -476,7 +607,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: "0" + grab(data, "levelcontrol.levelpercentage", fallback="0"),
                     "exclude_filter_function": lambda data: "levelcontrol" not in data.keys()
                 },
@@ -490,7 +621,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": str,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: grab(data, "etsiunitinfo.interfaces"),
                     "exclude_filter_function": lambda data: "etsiunitinfo" not in data.keys()
                 },
@@ -502,7 +633,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": str,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: grab(data, "etsiunitinfo.unittype"),
                     "exclude_filter_function": lambda data: "etsiunitinfo" not in data.keys()
                 },
@@ -516,7 +647,7 @@ lua_services.append(
                 "type": list,
                 "next": {
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: "0" + grab(data, "colorcontrol.current_mode", fallback="0"),
                     "exclude_filter_function": lambda data: "colorcontrol" not in data.keys()
                 },
@@ -527,7 +658,7 @@ lua_services.append(
                 "type": list,
                 "next": {
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: "0" + grab(data, "colorcontrol.hue", fallback="0"),
                     "exclude_filter_function": lambda data: "colorcontrol" not in data.keys()
                 },
@@ -538,7 +669,7 @@ lua_services.append(
                 "type": list,
                 "next": {
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: "0" + grab(data, "colorcontrol.saturation", fallback="0"),
                     "exclude_filter_function": lambda data: "colorcontrol" not in data.keys()
                 },
@@ -549,7 +680,7 @@ lua_services.append(
                 "type": list,
                 "next": {
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: "0" + grab(data, "colorcontrol.temperature", fallback="0"),
                     "exclude_filter_function": lambda data: "colorcontrol" not in data.keys()
                 },
@@ -562,7 +693,7 @@ lua_services.append(
                 "type": list,
                 "next": {
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": get_ha_alert_state,
                     "exclude_filter_function": lambda data: "alert" not in data.keys()
                 },
@@ -576,7 +707,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": float,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: (
                         avm_temp_map("0" + grab(data, "hkr.tist", fallback="0"), 0, 120, 0, 60)
                     ),
@@ -590,7 +721,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": float,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: (
                         avm_temp_map("0" + grab(data, "hkr.tsoll", fallback="253"), 16, 56, 8, 28)
                     ),
@@ -604,7 +735,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": float,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: (
                         avm_temp_map("0" + grab(data, "hkr.komfort", fallback="253"), 16, 56, 8, 28)
                     ),
@@ -618,7 +749,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": float,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: (
                         avm_temp_map("0" + grab(data, "hkr.absenk", fallback="253"), 16, 56, 8, 28)
                     ),
@@ -632,7 +763,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: "0" + grab(data, "hkr.lock", fallback="0"),
                     "exclude_filter_function": lambda data: "hkr" not in data.keys()
                 },
@@ -644,7 +775,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: "0" + grab(data, "hkr.devicelock", fallback="0"),
                     "exclude_filter_function": lambda data: "hkr" not in data.keys()
                 },
@@ -656,7 +787,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: "0" + grab(data, "hkr.errorcode", fallback="0"),
                     "exclude_filter_function": lambda data: "hkr" not in data.keys()
                 },
@@ -668,7 +799,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: "0" + grab(data, "hkr.windowopenactiv", fallback="0"),
                     "exclude_filter_function": lambda data: "hkr" not in data.keys()
                 },
@@ -680,7 +811,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: "0" + grab(data, "hkr.windowopenactiveendtime", fallback="0"),
                     "exclude_filter_function": lambda data: "hkr" not in data.keys()
                 },
@@ -692,7 +823,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: "0" + grab(data, "hkr.boostactive", fallback="0"),
                     "exclude_filter_function": lambda data: "hkr" not in data.keys()
                 },
@@ -704,7 +835,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: "0" + grab(data, "hkr.boostactiveendtime", fallback="0"),
                     "exclude_filter_function": lambda data: "hkr" not in data.keys()
                 },
@@ -716,7 +847,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: "0" + grab(data, "hkr.batterylow", fallback="0"),
                     "exclude_filter_function": lambda data: "hkr" not in data.keys()
                 },
@@ -728,7 +859,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: "0" + grab(data, "hkr.battery", fallback="0"),
                     "exclude_filter_function": lambda data: "hkr" not in data.keys()
                 },
@@ -740,7 +871,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: "0" + grab(data, "hkr.nextchange.endperiod", fallback="0"),
                     "exclude_filter_function": lambda data: "hkr" not in data.keys()
                 },
@@ -752,7 +883,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": float,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: (
                         avm_temp_map("0" + grab(data, "hkr.nextchange.tchange", fallback="0"), 16, 56, 8, 28)
                     ),
@@ -766,7 +897,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: "0" + grab(data, "hkr.summeractive", fallback="0"),
                     "exclude_filter_function": lambda data: "hkr" not in data.keys()
                 },
@@ -778,7 +909,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"name": data.get("name")},
+                    "tags_function": get_device_tags,
                     "value_function": lambda data: "0" + grab(data, "hkr.holidayactive", fallback="0"),
                     "exclude_filter_function": lambda data: "hkr" not in data.keys()
                 },
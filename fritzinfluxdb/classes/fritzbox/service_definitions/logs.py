@@ -7,17 +7,11 @@
 #  For a copy, see file LICENSE.txt included in this
 #  repository or visit: <https://opensource.org/licenses/MIT>.
 
-from datetime import datetime
-
+from fritzinfluxdb.common import parse_avm_datetime
+from fritzinfluxdb.classes.fritzbox.json_decoder import prepare_json_response_data
 from fritzinfluxdb.classes.fritzbox.service_definitions import lua_services
 
-
-def prepare_json_response_data(response):
-    """
-    handler to prepare returned json data for parsing
-    """
-
-    return response.json()
+read_interval = 60
 
 
 lua_services.append(
@@ -33,7 +27,8 @@ lua_services.append(
         },
         "response_parser": prepare_json_response_data,
         "track": True,
-        "interval": 60,
+        "incremental": True,
+        "interval": read_interval,
         "value_instances": {
             "log_entry": {
                 "data_path": "data.log",
@@ -45,7 +40,7 @@ lua_services.append(
                         "log_type": "System"
                     },
                     "timestamp_function": lambda data:
-                        datetime.strptime(f'{data[0]} {data[1]}', '%d.%m.%y %H:%M:%S'),
+                        parse_avm_datetime(data[0], data[1]),
                     "value_function": lambda data: data[2],
                     "tags_function": None
                 }
@@ -65,7 +60,8 @@ lua_services.append(
         },
         "response_parser": prepare_json_response_data,
         "track": True,
-        "interval": 60,
+        "incremental": True,
+        "interval": read_interval,
         "value_instances": {
             "log_entry": {
                 "data_path": "data.log",
@@ -77,7 +73,7 @@ lua_services.append(
                         "log_type": "System"
                     },
                     "timestamp_function": lambda data:
-                        datetime.strptime(f'{data.get("date")} {data.get("time")}', '%d.%m.%y %H:%M:%S'),
+                        parse_avm_datetime(data.get("date"), data.get("time")),
                     "value_function": lambda data: data.get("msg"),
                     "tags_function": None
                 }
@@ -98,7 +94,8 @@ lua_services.append(
         },
         "response_parser": prepare_json_response_data,
         "track": True,
-        "interval": 61,
+        "incremental": True,
+        "interval": read_interval,
         "value_instances": {
             "log_entry": {
                 "data_path": "data.log",
@@ -110,7 +107,7 @@ lua_services.append(
                         "log_type": "Internet connection"
                     },
                     "timestamp_function": lambda data:
-                        datetime.strptime(f'{data[0]} {data[1]}', '%d.%m.%y %H:%M:%S'),
+                        parse_avm_datetime(data[0], data[1]),
                     "value_function": lambda data: data[2],
                     "tags_function": None
                 }
@@ -130,7 +127,8 @@ lua_services.append(
         },
         "response_parser": prepare_json_response_data,
         "track": True,
-        "interval": 61,
+        "incremental": True,
+        "interval": read_interval,
         "value_instances": {
             "log_entry": {
                 "data_path": "data.log",
@@ -142,7 +140,7 @@ lua_services.append(
                         "log_type": "Internet connection"
                     },
                     "timestamp_function": lambda data:
-                        datetime.strptime(f'{data.get("date")} {data.get("time")}', '%d.%m.%y %H:%M:%S'),
+                        parse_avm_datetime(data.get("date"), data.get("time")),
                     "value_function": lambda data: data.get("msg"),
                     "tags_function": None
                 }
@@ -163,7 +161,8 @@ lua_services.append(
         },
         "response_parser": prepare_json_response_data,
         "track": True,
-        "interval": 62,
+        "incremental": True,
+        "interval": read_interval,
         "value_instances": {
             "log_entry": {
                 "data_path": "data.log",
@@ -175,7 +174,7 @@ lua_services.append(
                         "log_type": "Telephony"
                     },
                     "timestamp_function": lambda data:
-                        datetime.strptime(f'{data[0]} {data[1]}', '%d.%m.%y %H:%M:%S'),
+                        parse_avm_datetime(data[0], data[1]),
                     "value_function": lambda data: data[2],
                     "tags_function": None
                 }
@@ -195,7 +194,8 @@ lua_services.append(
         },
         "response_parser": prepare_json_response_data,
         "track": True,
-        "interval": 62,
+        "incremental": True,
+        "interval": read_interval,
         "value_instances": {
             "log_entry": {
                 "data_path": "data.log",
@@ -207,7 +207,7 @@ lua_services.append(
                         "log_type": "Telephony"
                     },
                     "timestamp_function": lambda data:
-                        datetime.strptime(f'{data.get("date")} {data.get("time")}', '%d.%m.%y %H:%M:%S'),
+                        parse_avm_datetime(data.get("date"), data.get("time")),
                     "value_function": lambda data: data.get("msg"),
                     "tags_function": None
                 }
@@ -228,7 +228,8 @@ lua_services.append(
         },
         "response_parser": prepare_json_response_data,
         "track": True,
-        "interval": 63,
+        "incremental": True,
+        "interval": read_interval,
         "value_instances": {
             "log_entry": {
                 "data_path": "data.log",
@@ -240,7 +241,7 @@ lua_services.append(
                         "log_type": "WLAN"
                     },
                     "timestamp_function": lambda data:
-                        datetime.strptime(f'{data[0]} {data[1]}', '%d.%m.%y %H:%M:%S'),
+                        parse_avm_datetime(data[0], data[1]),
                     "value_function": lambda data: data[2],
                     "tags_function": None
                 }
@@ -260,7 +261,8 @@ lua_services.append(
         },
         "response_parser": prepare_json_response_data,
         "track": True,
-        "interval": 63,
+        "incremental": True,
+        "interval": read_interval,
         "value_instances": {
             "log_entry": {
                 "data_path": "data.log",
@@ -272,7 +274,7 @@ lua_services.append(
                         "log_type": "WLAN"
                     },
                     "timestamp_function": lambda data:
-                        datetime.strptime(f'{data.get("date")} {data.get("time")}', '%d.%m.%y %H:%M:%S'),
+                        parse_avm_datetime(data.get("date"), data.get("time")),
                     "value_function": lambda data: data.get("msg"),
                     "tags_function": None
                 }
@@ -293,7 +295,8 @@ lua_services.append(
         },
         "response_parser": prepare_json_response_data,
         "track": True,
-        "interval": 64,
+        "incremental": True,
+        "interval": read_interval,
         "value_instances": {
             "log_entry": {
                 "data_path": "data.log",
@@ -305,7 +308,7 @@ lua_services.append(
                         "log_type": "USB Devices"
                     },
                     "timestamp_function": lambda data:
-                        datetime.strptime(f'{data[0]} {data[1]}', '%d.%m.%y %H:%M:%S'),
+                        parse_avm_datetime(data[0], data[1]),
                     "value_function": lambda data: data[2],
                     "tags_function": None
                 }
@@ -325,7 +328,8 @@ lua_services.append(
         },
         "response_parser": prepare_json_response_data,
         "track": True,
-        "interval": 64,
+        "incremental": True,
+        "interval": read_interval,
         "value_instances": {
             "log_entry": {
                 "data_path": "data.log",
@@ -337,7 +341,7 @@ lua_services.append(
                         "log_type": "USB Devices"
                     },
                     "timestamp_function": lambda data:
-                        datetime.strptime(f'{data.get("date")} {data.get("time")}', '%d.%m.%y %H:%M:%S'),
+                        parse_avm_datetime(data.get("date"), data.get("time")),
                     "value_function": lambda data: data.get("msg"),
                     "tags_function": None
                 }
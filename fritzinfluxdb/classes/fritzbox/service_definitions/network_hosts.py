@@ -9,6 +9,7 @@
 
 import re
 
+from fritzinfluxdb.classes.fritzbox.json_decoder import prepare_json_response_data
 from fritzinfluxdb.classes.fritzbox.service_definitions import lua_services
 
 # precompile active_host_txt_regex
@@ -23,7 +24,11 @@ active_host_txt_regex = \
     re.compile(r"((?P<frequency>[0-9,]+) GHz)*(, )*((?P<downstream>\d+) / (?P<upstream>\d+) .*bit.*)*")
 
 
-def get_active_host_details(data, desired_value: str, fallback_value):
+def parse_active_host_details(data):
+    """
+    parse the properties of an active host, used as 'prepare_function' so the properties
+    of a host only get parsed once for all metrics of this host.
+    """
 
     property_list = data.get("properties")
 
@@ -32,26 +37,32 @@ def get_active_host_details(data, desired_value: str, fallback_value):
 
     txt_list = [x.get("txt") for x in property_list]
 
-    if desired_value == "additional_text":
-        return ", ".join(txt_list)
-
-    if desired_value == "is_mesh":
-        return True if "Mesh" in txt_list else False
+    details = {
+        "additional_text": ", ".join(txt_list),
+        "is_mesh": True if "Mesh" in txt_list else False
+    }
 
     regex_matches = active_host_txt_regex.match(next((x for x in txt_list if "GHz" in x or "bit" in x), ""))
 
-    if regex_matches is None:
-        return fallback_value
+    if regex_matches is not None:
+        details.update({k: v for k, v in regex_matches.groupdict().items() if k not in details})
 
-    return regex_matches.groupdict(fallback_value).get(desired_value, fallback_value)
+    return details
 
 
-def prepare_json_response_data(response):
-    """
-    handler to prepare returned json data for parsing
-    """
+def get_active_host_details(details, desired_value: str, fallback_value):
+
+    value = details.get(desired_value)
+
+    return value if value is not None else fallback_value
+
+
+def get_host_tags(data):
+    return {"uid": data.get("UID")}
+
 
-    return response.json()
+def get_named_host_tags(data):
+    return {"uid": data.get("UID"), "name": data.get("name")}
 
 
 # every 2 minutes
@@ -76,7 +87,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": str,
-                    "tags_function": lambda data: {"uid": data.get("UID")},
+                    "tags_function": get_host_tags,
                     "value_function": lambda data: data.get("name")
                 }
             },
@@ -86,7 +97,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": str,
-                    "tags_function": lambda data: {"uid": data.get("UID")},
+                    "tags_function": get_host_tags,
                     "value_function": lambda data: data.get("mac")
                 }
             },
@@ -96,7 +107,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": str,
-                    "tags_function": lambda data: {"uid": data.get("UID")},
+                    "tags_function": get_host_tags,
                     "value_function": lambda data: data.get("type")
                 }
             },
@@ -106,7 +117,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": str,
-                    "tags_function": lambda data: {"uid": data.get("UID")},
+                    "tags_function": get_host_tags,
                     "value_function": lambda data: data.get("parent", dict()).get("name")
                 }
             },
@@ -116,7 +127,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": str,
-                    "tags_function": lambda data: {"uid": data.get("UID")},
+                    "tags_function": get_host_tags,
                     "value_function": lambda data: data.get("port")
                 }
             },
@@ -126,7 +137,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": str,
-                    "tags_function": lambda data: {"uid": data.get("UID")},
+                    "tags_function": get_host_tags,
                     "value_function": lambda data: data.get("ipv4", dict()).get("ip")
                 }
             },
@@ -136,7 +147,7 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"uid": data.get("UID"), "name": data.get("name")},
+                    "tags_function": get_named_host_tags,
                     "value_function": lambda data: data.get("ipv4", dict()).get("lastused", 0)
                 }
             },
@@ -146,8 +157,9 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": str,
-                    "tags_function": lambda data: {"uid": data.get("UID"), "name": data.get("name")},
-                    "value_function": lambda data: get_active_host_details(data, "additional_text", "")
+                    "tags_function": get_named_host_tags,
+                    "prepare_function": parse_active_host_details,
+                    "value_function": lambda details: get_active_host_details(details, "additional_text", "")
                 }
             },
             "active_hosts_is_mesh": {
@@ -156,8 +168,9 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": bool,
-                    "tags_function": lambda data: {"uid": data.get("UID"), "name": data.get("name")},
-                    "value_function": lambda data: get_active_host_details(data, "is_mesh", False)
+                    "tags_function": get_named_host_tags,
+                    "prepare_function": parse_active_host_details,
+                    "value_function": lambda details: get_active_host_details(details, "is_mesh", False)
                 }
             },
             "active_hosts_frequency": {
@@ -166,8 +179,9 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": str,
-                    "tags_function": lambda data: {"uid": data.get("UID"), "name": data.get("name")},
-                    "value_function": lambda data: get_active_host_details(data, "frequency", "")
+                    "tags_function": get_named_host_tags,
+                    "prepare_function": parse_active_host_details,
+                    "value_function": lambda details: get_active_host_details(details, "frequency", "")
                 }
             },
             "active_hosts_downstream": {
@@ -176,8 +190,9 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"uid": data.get("UID"), "name": data.get("name")},
-                    "value_function": lambda data: get_active_host_details(data, "downstream", 0)
+                    "tags_function": get_named_host_tags,
+                    "prepare_function": parse_active_host_details,
+                    "value_function": lambda details: get_active_host_details(details, "downstream", 0)
                 }
             },
             "active_hosts_upstream": {
@@ -186,8 +201,9 @@ lua_services.append(
                 "next": {
                     # data struct type: dict
                     "type": int,
-                    "tags_function": lambda data: {"uid": data.get("UID"), "name": data.get("name")},
-                    "value_function": lambda data: get_active_host_details(data, "upstream", 0)
+                    "tags_function": get_named_host_tags,
+                    "prepare_function": parse_active_host_details,
+                    "value_function": lambda details: get_active_host_details(details, "upstream", 0)
                 }
             },
             "num_active_host": {
@@ -218,7 +234,7 @@ lua_services.append({
                 "next": {
                     # data struct type: dict
                     "type": str,
-                    "tags_function": lambda data: {"uid": data.get("UID")},
+                    "tags_function": get_host_tags,
                     "value_function": lambda data: data.get("name")
                 }
             },
@@ -228,7 +244,7 @@ lua_services.append({
                 "next": {
                     # data struct type: dict
                     "type": str,
-                    "tags_function": lambda data: {"uid": data.get("UID")},
+                    "tags_function": get_host_tags,
                     "value_function": lambda data: data.get("mac")
                 }
             },
@@ -238,7 +254,7 @@ lua_services.append({
                 "next": {
                     # data struct type: dict
                     "type": str,
-                    "tags_function": lambda data: {"uid": data.get("UID")},
+                    "tags_function": get_host_tags,
                     "value_function": lambda data: data.get("port")
                 }
             },
@@ -248,7 +264,7 @@ lua_services.append({
                 "next": {
                     # data struct type: dict
                     "type": str,
-                    "tags_function": lambda data: {"uid": data.get("UID")},
+                    "tags_function": get_host_tags,
                     "value_function": lambda data: data.get("ipv4", dict()).get("ip")
                 }
             },
@@ -7,19 +7,12 @@
 #  For a copy, see file LICENSE.txt included in this
 #  repository or visit: <https://opensource.org/licenses/MIT>.
 
+from fritzinfluxdb.classes.fritzbox.json_decoder import prepare_json_response_data
 from fritzinfluxdb.classes.fritzbox.service_definitions import lua_services
 
 read_interval = 150
 
 
-def prepare_json_response_data(response):
-    """
-    handler to prepare returned json data for parsing
-    """
-
-    return response.json()
-
-
 lua_services.append(
     {
         "name": "System Stats",
@@ -8,8 +8,8 @@
 #  repository or visit: <https://opensource.org/licenses/MIT>.
 
 import hashlib
-from datetime import datetime
 
+from fritzinfluxdb.common import parse_avm_datetime
 from fritzinfluxdb.classes.fritzbox.service_handler import FritzBoxLuaURLPath
 from fritzinfluxdb.classes.fritzbox.service_definitions import lua_services
 
@@ -34,7 +34,8 @@ def get_hash(data):
 
 
 def get_date(data):
-    return datetime.strptime(data.split(";")[1], '%d.%m.%y %H:%M')
+    date, time = data.split(";")[1].split(" ")
+    return parse_avm_datetime(date, time)
 
 
 def get_call_type(data):
@@ -7,16 +7,13 @@
 #  For a copy, see file LICENSE.txt included in this
 #  repository or visit: <https://opensource.org/licenses/MIT>.
 
-from fritzinfluxdb.common import grab
+from fritzinfluxdb.common import compile_path
+from fritzinfluxdb.classes.fritzbox.json_decoder import prepare_json_response_data
 from fritzinfluxdb.classes.fritzbox.service_definitions import lua_services
 
-
-def prepare_json_response_data(response):
-    """
-    handler to prepare returned json data for parsing
-    """
-
-    return response.json()
+vpn_info_user_connections_path = compile_path("data.vpnInfo.userConnections")
+init_user_connections_path = compile_path("data.init.userConnections")
+init_box_connections_path = compile_path("data.init.boxConnections")
 
 
 lua_services.append({
@@ -47,7 +44,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("connected"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "IPSec"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.vpnInfo.userConnections"), dict)
+                "exclude_filter_function": lambda data: not isinstance(vpn_info_user_connections_path.get(data), dict)
             },
             "vpn_user_active": {
                 "data_path": "data.vpnInfo.userConnections",
@@ -57,7 +54,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("active"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "IPSec"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.vpnInfo.userConnections"), dict)
+                "exclude_filter_function": lambda data: not isinstance(vpn_info_user_connections_path.get(data), dict)
             },
             "vpn_user_virtual_address": {
                 "data_path": "data.vpnInfo.userConnections",
@@ -67,7 +64,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("virtualAddress"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "IPSec"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.vpnInfo.userConnections"), dict)
+                "exclude_filter_function": lambda data: not isinstance(vpn_info_user_connections_path.get(data), dict)
             },
             "vpn_user_remote_address": {
                 "data_path": "data.vpnInfo.userConnections",
@@ -77,20 +74,20 @@ lua_services.append({
                     "value_function": lambda data: data.get("address"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "IPSec"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.vpnInfo.userConnections"), dict)
+                "exclude_filter_function": lambda data: not isinstance(vpn_info_user_connections_path.get(data), dict)
             },
             "vpn_user_num_active": {
                 "type": int,
                 "value_function": (lambda data:
                                    len(
-                                       [x for x in grab(data, "data.vpnInfo.userConnections", fallback=dict()).values()
+                                       [x for x in vpn_info_user_connections_path.get(data, fallback=dict()).values()
                                         if x.get("connected") is True]
                                    )
                                    ),
                 "tags": {
                     "vpn_type": "IPSec"
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.vpnInfo.userConnections"), dict)
+                "exclude_filter_function": lambda data: not isinstance(vpn_info_user_connections_path.get(data), dict)
             }
         }
     }
@@ -123,7 +120,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("connected"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "IPSec"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.init.userConnections"), dict)
+                "exclude_filter_function": lambda data: not isinstance(init_user_connections_path.get(data), dict)
             },
             "vpn_user_active": {
                 "data_path": "data.init.userConnections",
@@ -133,7 +130,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("active"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "IPSec"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.init.userConnections"), dict)
+                "exclude_filter_function": lambda data: not isinstance(init_user_connections_path.get(data), dict)
             },
             "vpn_user_virtual_address": {
                 "data_path": "data.init.userConnections",
@@ -143,7 +140,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("virtualAddress"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "IPSec"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.init.userConnections"), dict)
+                "exclude_filter_function": lambda data: not isinstance(init_user_connections_path.get(data), dict)
             },
             "vpn_user_remote_address": {
                 "data_path": "data.init.userConnections",
@@ -153,20 +150,20 @@ lua_services.append({
                     "value_function": lambda data: data.get("address"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "IPSec"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.init.userConnections"), dict)
+                "exclude_filter_function": lambda data: not isinstance(init_user_connections_path.get(data), dict)
             },
             "vpn_user_num_active": {
                 "type": int,
                 "value_function": (lambda data:
                                    len(
-                                       [x for x in grab(data, "data.init.userConnections", fallback=dict()).values()
+                                       [x for x in init_user_connections_path.get(data, fallback=dict()).values()
                                         if x.get("connected") is True]
                                    )
                                    ),
                 "tags": {
                     "vpn_type": "IPSec"
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.init.userConnections"), dict)
+                "exclude_filter_function": lambda data: not isinstance(init_user_connections_path.get(data), dict)
             }
         }
     }
@@ -200,7 +197,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("connected"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "WireGuard"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.init.boxConnections"), dict)
+                "exclude_filter_function": lambda data: not isinstance(init_box_connections_path.get(data), dict)
             },
             "vpn_user_active": {
                 "data_path": "data.init.boxConnections",
@@ -210,7 +207,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("active"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "WireGuard"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.init.boxConnections"), dict)
+                "exclude_filter_function": lambda data: not isinstance(init_box_connections_path.get(data), dict)
             },
             "vpn_user_virtual_address": {
                 "data_path": "data.init.boxConnections",
@@ -220,7 +217,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("remoteNet"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "WireGuard"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.init.boxConnections"), dict)
+                "exclude_filter_function": lambda data: not isinstance(init_box_connections_path.get(data), dict)
             },
             "vpn_user_remote_address": {
                 "data_path": "data.init.boxConnections",
@@ -230,20 +227,20 @@ lua_services.append({
                     "value_function": lambda data: data.get("remoteIp"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "WireGuard"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.init.boxConnections"), dict)
+                "exclude_filter_function": lambda data: not isinstance(init_box_connections_path.get(data), dict)
             },
             "vpn_user_num_active": {
                 "type": int,
                 "value_function": (lambda data:
                                    len(
-                                    [x for x in grab(data, "data.init.boxConnections", fallback=dict()).values()
+                                    [x for x in init_box_connections_path.get(data, fallback=dict()).values()
                                         if x.get("connected") is True]
                                    )
                                    ),
                 "tags": {
                     "vpn_type": "WireGuard"
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.init.boxConnections"), dict)
+                "exclude_filter_function": lambda data: not isinstance(init_box_connections_path.get(data), dict)
             }
         }
     }
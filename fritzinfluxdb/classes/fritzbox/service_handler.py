@@ -8,12 +8,15 @@
 #  repository or visit: <https://opensource.org/licenses/MIT>.
 
 from typing import Union, AnyStr, Dict
+import time
 import pytz
 from datetime import datetime
 
 from fritzinfluxdb.common import do_error_exit
 from fritzinfluxdb.log import get_logger
 from fritzinfluxdb.classes.common import FritzMeasurement
+from fritzinfluxdb.classes.fritzbox.measurement_tracker import MeasurementTracker
+from fritzinfluxdb.classes.fritzbox.extraction_plan import ExtractionPlan
 
 log = get_logger()
 
@@ -92,19 +95,6 @@ class FritzBoxService:
         """
         self.last_query = datetime.now(pytz.utc)
 
-    def should_be_requested(self):
-        """
-        determines if conditions are fulfilled to request this service again
-        """
-
-        if self.available is False:
-            return False
-
-        if self.last_query and (datetime.now(pytz.utc)-self.last_query).total_seconds() < self.interval:
-            return False
-
-        return True
-
 
 class FritzBoxTR069Service(FritzBoxService):
     """
@@ -155,6 +145,10 @@ class FritzBoxLuaService(FritzBoxService):
     default_url_path = FritzBoxLuaURLPath.data
     link_type = None
 
+    # time window in seconds in which tracked measurements are remembered,
+    # can be defined per service with 'track_horizon'
+    track_horizon = 60 * 60 * 24
+
     def __init__(self, service_data=None):
 
         super().__init__(service_data)
@@ -180,9 +174,20 @@ class FritzBoxLuaService(FritzBoxService):
 
         self.validate_value_instances()
 
+        # compile the value instances once, used to extract the measurements of every response
+        self.extraction_plan = ExtractionPlan(self.name, self.value_instances)
+
         # used for services parsing log entries
         self.track_measurements = bool(service_data.get("track", False))
-        self.tracked_measurements = set()
+        self.tracked_measurements = MeasurementTracker(service_data.get("track_horizon", self.track_horizon))
+
+        # for tracked services which return entries newest first,
+        # stop extracting entries once an entry older than the last request is reached
+        self.incremental = self.track_measurements is True and bool(service_data.get("incremental", False))
+
+        # number and newest timestamp of tracked entries ahead of the local clock in the current response
+        self.num_future_entries = 0
+        self.newest_future_timestamp = None
 
     def validate_value_instances(self):
         """
@@ -204,7 +209,7 @@ class FritzBoxLuaService(FritzBoxService):
         which have not been seen before
         """
 
-        if self.track_measurements is True and hash(measurement) in self.tracked_measurements:
+        if self.track_measurements is True and measurement in self.tracked_measurements:
             return True
 
         return False
@@ -214,8 +219,61 @@ class FritzBoxLuaService(FritzBoxService):
         adds a measurement to the tracking list
         """
 
+        if self.track_measurements is not True:
+            return
+
+        if measurement.timestamp.timestamp() > time.time() + self.tracked_measurements.max_clock_skew:
+            self.num_future_entries += 1
+            if self.newest_future_timestamp is None or measurement.timestamp > self.newest_future_timestamp:
+                self.newest_future_timestamp = measurement.timestamp
+
+        self.tracked_measurements.add(measurement)
+
+    def report_future_entries(self):
+        """
+        log a single warning if the last response contained entries ahead of the local clock
+        """
+
+        if self.num_future_entries == 0:
+            return
+
+        log.warning(f"Service '{self.name}' returned {self.num_future_entries} entries which are ahead of "
+                    f"the local clock (newest: '{self.newest_future_timestamp}'), "
+                    f"please check the time of the FritzBox")
+
+        self.num_future_entries = 0
+        self.newest_future_timestamp = None
+
+    @property
+    def state_key(self):
+        """
+        key to store the state of this service, unique for every service definition
+        """
+
+        os_versions = f"{self.os_min_versions} - {self.os_max_versions or 'latest'}"
+
+        return f"{self.name} ({self.url_path}, Fritz!OS {os_versions})"
+
+    def get_high_water_mark(self):
+        """
+        returns the timestamp of the newest tracked measurement as seconds since epoch
+        if this service is incremental, otherwise None. The timestamp is limited to the local time,
+        so an entry dated in the future doesn't stop the extraction of all following entries.
+        """
+
+        if self.incremental is False or self.tracked_measurements.newest_timestamp is None:
+            return None
+
+        return min(self.tracked_measurements.newest_timestamp, time.time())
+
+    def evict_tracked_measurements(self):
+        """
+        forget tracked measurements which are older than the tracking horizon,
+        needs to be called after all measurements of a request have been handled
+        """
+
         if self.track_measurements is True:
-            self.tracked_measurements.add(hash(measurement))
+            self.tracked_measurements.evict()
 
     @staticmethod
     def response_parser(response):
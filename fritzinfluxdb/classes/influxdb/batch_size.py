@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+
+class BatchSizeController:
+    """
+        Adjusts the number of measurements written with each InfluxDB write (AIMD).
+
+        While writes finish well within the target latency, the batch size is doubled.
+        Close to the target latency it grows by the initial size with every write, and it
+        is halved as soon as a write takes longer than the target latency or fails.
+
+        The batch size is also limited by the encoded payload size, based on the average
+        number of bytes per measurement of previous writes.
+    """
+
+    # factor to apply to the batch size if a write was too slow or failed
+    decrease_factor = 0.5
+
+    # writes faster than this fraction of the target latency double the batch size
+    fast_write_fraction = 0.25
+
+    # weight of the latest write to calculate the average number of bytes per measurement
+    bytes_per_measurement_weight = 0.2
+
+    def __init__(self, initial_size, max_size, max_bytes, target_latency):
+        """
+        Parameters
+        ----------
+        initial_size: int
+            batch size to start with, also used as additive increase
+        max_size: int
+            max number of measurements per batch
+        max_bytes: int
+            max size of the encoded payload of a batch in bytes
+        target_latency: int, float
+            max number of seconds a write should take
+        """
+
+        self.initial_size = initial_size
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.target_latency = target_latency
+
+        self.size = initial_size
+        self.bytes_per_measurement = None
+
+    def limit(self, size):
+        """
+        returns the size limited to the range of 1 and the max number of measurements and bytes per batch
+        """
+
+        max_size = self.max_size
+        if self.bytes_per_measurement is not None:
+            max_size = min(max_size, int(self.max_bytes / self.bytes_per_measurement))
+
+        return int(max(min(size, max_size), 1))
+
+    def write_succeeded(self, num_measurements, num_bytes, latency):
+        """
+        adjust the batch size after a successful write
+
+        Parameters
+        ----------
+        num_measurements: int
+            number of measurements which have been written
+        num_bytes: int
+            size of the encoded payload in bytes
+        latency: float
+            number of seconds it took to write the data
+        """
+
+        if num_measurements > 0 and num_bytes > 0:
+            bytes_per_measurement = num_bytes / num_measurements
+            if self.bytes_per_measurement is None:
+                self.bytes_per_measurement = bytes_per_measurement
+            else:
+                self.bytes_per_measurement += \
+                    (bytes_per_measurement - self.bytes_per_measurement) * self.bytes_per_measurement_weight
+
+        if latency > self.target_latency:
+            self.size = self.limit(self.size * self.decrease_factor)
+
+        # only grow if the batch has been used completely
+        elif num_measurements < self.size:
+            self.size = self.limit(self.size)
+
+        elif latency < self.target_latency * self.fast_write_fraction:
+            self.size = self.limit(self.size * 2)
+
+        else:
+            self.size = self.limit(self.size + self.initial_size)
+
+    def write_failed(self):
+        """
+        reduce the batch size after a write failed
+        """
+
+        self.size = self.limit(self.size * self.decrease_factor)
+
+# EOF
@@ -0,0 +1,437 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import bisect
+import struct
+from array import array
+from collections import deque, Counter
+from datetime import timedelta
+from itertools import chain, islice
+
+from fritzinfluxdb.classes.common import FritzMeasurement, WritePrecision
+from fritzinfluxdb.classes.influxdb.line_protocol import encode_timestamp, epoch
+
+double_struct = struct.Struct("d")
+int64_struct = struct.Struct("q")
+
+
+class MeasurementBuffer:
+    """
+        Bounded buffer for measurements which are waiting to be written to InfluxDB.
+
+        Measurements are kept in buckets per minute of their timestamp, and the bucket
+        keys are kept in order. Buckets are always drained oldest first, and the oldest
+        buckets are discarded first once the buffer is full. Removing all measurements
+        older than a given timestamp only needs to look at the affected buckets.
+
+        The order is only kept per minute: within a bucket measurements stay in the order
+        they have been added. Measurements are only appended to a bucket, so the positions of
+        a batch which is currently written don't change while new measurements arrive.
+    """
+
+    # time span of a single bucket in seconds
+    bucket_duration = 60
+
+    def __init__(self, max_size):
+        """
+        Parameters
+        ----------
+        max_size: int
+            max number of measurements to keep, the oldest measurements get discarded first
+        """
+
+        self.max_size = max_size
+        self.num_discarded = 0
+
+        self._length = 0
+        self._buckets = dict()
+        # sorted list of bucket keys
+        self._bucket_keys = list()
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return chain.from_iterable(self._buckets[key] for key in self._bucket_keys)
+
+    def get_bucket_key(self, timestamp):
+        return int(timestamp.timestamp()) // self.bucket_duration
+
+    def new_bucket(self):
+        return deque()
+
+    def slice_bucket(self, bucket, start, stop):
+        return islice(bucket, start, stop)
+
+    def split_bucket(self, bucket, timestamp):
+        """
+        returns a list of all measurements of the bucket which are older than 'timestamp'
+        and a new bucket with all remaining measurements
+        """
+
+        return [x for x in bucket if x.timestamp < timestamp], deque(x for x in bucket if x.timestamp >= timestamp)
+
+    def release_bucket(self, bucket):
+        """
+        called for every bucket which is dropped from the buffer
+        """
+
+        pass
+
+    def remove_bucket(self, key):
+
+        self._bucket_keys.remove(key)
+        bucket = self._buckets.pop(key)
+        self._length -= len(bucket)
+        self.release_bucket(bucket)
+
+    def append(self, measurement):
+        """
+        add a measurement to the buffer. If the buffer is full, the oldest measurement is discarded.
+        """
+
+        key = self.get_bucket_key(measurement.timestamp)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = self.new_bucket()
+
+            # measurements usually arrive in order, so new buckets are added to the end
+            if len(self._bucket_keys) == 0 or key > self._bucket_keys[-1]:
+                self._bucket_keys.append(key)
+            else:
+                bisect.insort(self._bucket_keys, key)
+
+        bucket.append(measurement)
+        self._length += 1
+
+        if self._length > self.max_size:
+            oldest_bucket = self._buckets[self._bucket_keys[0]]
+            oldest_bucket.popleft()
+            self._length -= 1
+            self.num_discarded += 1
+
+            if len(oldest_bucket) == 0:
+                self.remove_bucket(self._bucket_keys[0])
+
+    def get_batch(self, size, offset=0):
+        """
+        returns a list of the 'size' next measurements (oldest minute first) starting at 'offset'
+        without removing them from the buffer
+        """
+
+        batch = list()
+        for key in self._bucket_keys:
+            bucket = self._buckets[key]
+
+            if offset >= len(bucket):
+                offset -= len(bucket)
+                continue
+
+            batch.extend(self.slice_bucket(bucket, offset, offset + size - len(batch)))
+            offset = 0
+
+            if len(batch) >= size:
+                break
+
+        return batch
+
+    def remove_batch(self, size):
+        """
+        remove the 'size' next measurements (oldest minute first), i.e. after they have been written successfully
+        """
+
+        while size > 0 and len(self._bucket_keys) > 0:
+            bucket = self._buckets[self._bucket_keys[0]]
+
+            if size >= len(bucket):
+                size -= len(bucket)
+                self.remove_bucket(self._bucket_keys[0])
+                continue
+
+            for _ in range(size):
+                bucket.popleft()
+            self._length -= size
+            size = 0
+
+    def remove_older_than(self, timestamp):
+        """
+        remove all measurements which are older than 'timestamp' and return them
+        """
+
+        removed = list()
+        timestamp_key = self.get_bucket_key(timestamp)
+
+        while len(self._bucket_keys) > 0 and self._bucket_keys[0] < timestamp_key:
+            removed.extend(self._buckets[self._bucket_keys[0]])
+            self.remove_bucket(self._bucket_keys[0])
+
+        # only the bucket containing the timestamp needs to be checked for single measurements
+        bucket = self._buckets.get(timestamp_key)
+        if bucket is not None:
+            removed_from_bucket, remaining_bucket = self.split_bucket(bucket, timestamp)
+
+            if len(removed_from_bucket) > 0:
+                removed.extend(removed_from_bucket)
+                self.release_bucket(bucket)
+                bucket = self._buckets[timestamp_key] = remaining_bucket
+                self._length -= len(removed_from_bucket)
+
+                if len(bucket) == 0:
+                    self.remove_bucket(timestamp_key)
+
+        return removed
+
+    def pop_num_discarded(self):
+        """
+        returns the number of measurements discarded since the last call and resets the counter
+        """
+
+        num_discarded = self.num_discarded
+        self.num_discarded = 0
+
+        return num_discarded
+
+
+class InternTable:
+    """
+        Assigns small integer IDs to values. The IDs are reference counted, once a value
+        isn't referenced anymore it is dropped and its ID gets reused.
+    """
+
+    def __init__(self):
+
+        self.values = list()
+        self._ids = dict()
+        self._keys = list()
+        self._references = list()
+        self._free_ids = list()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, value_id):
+        return self.values[value_id]
+
+    def add(self, key, value):
+        """
+        returns the ID of the value and adds a reference to it
+
+        Parameters
+        ----------
+        key: hashable
+            the key to identify the value
+        value: any
+            the value to intern
+        """
+
+        value_id = self._ids.get(key)
+
+        if value_id is None:
+            if len(self._free_ids) > 0:
+                value_id = self._free_ids.pop()
+                self.values[value_id] = value
+                self._keys[value_id] = key
+                self._references[value_id] = 0
+            else:
+                value_id = len(self.values)
+                self.values.append(value)
+                self._keys.append(key)
+                self._references.append(0)
+
+            self._ids[key] = value_id
+
+        self._references[value_id] += 1
+
+        return value_id
+
+    def release(self, value_id, count=1):
+        """
+        remove 'count' references to the value with this ID
+        """
+
+        self._references[value_id] -= count
+
+        if self._references[value_id] > 0:
+            return
+
+        del self._ids[self._keys[value_id]]
+        self.values[value_id] = None
+        self._keys[value_id] = None
+        self._free_ids.append(value_id)
+
+
+class CompactBucket:
+    """
+        Holds the measurements of a single bucket of a CompactMeasurementBuffer as columns.
+
+        Names and tag sets are stored as IDs of the interned values of the buffer, timestamps as
+        microseconds since epoch. Numeric values are stored as int64, floats by their bit pattern.
+        All other values are kept as objects and the value column holds their index.
+        The spool segment of a measurement is kept as well, -1 if there is none.
+
+        Measurements are only removed from the front of a bucket, this is done by moving the
+        start index. The memory is released once the whole bucket gets removed.
+    """
+
+    __slots__ = ("buffer", "start", "names", "tag_sets", "timestamps", "value_types", "values", "objects",
+                 "spool_segments")
+
+    value_type_int = 0
+    value_type_float = 1
+    value_type_bool = 2
+    value_type_object = 3
+
+    def __init__(self, buffer):
+        """
+        Parameters
+        ----------
+        buffer: CompactMeasurementBuffer
+            the buffer which holds the interned names and tag sets
+        """
+
+        self.buffer = buffer
+        self.start = 0
+        self.names = array("I")
+        self.tag_sets = array("I")
+        self.timestamps = array("q")
+        self.value_types = array("B")
+        self.values = array("q")
+        self.objects = list()
+        self.spool_segments = array("q")
+
+    def __len__(self):
+        return len(self.timestamps) - self.start
+
+    def __iter__(self):
+        return iter(self.get_measurements(0, len(self)))
+
+    def append(self, measurement):
+
+        value = measurement.value
+
+        if isinstance(value, bool):
+            value_type = self.value_type_bool
+            value = int(value)
+        elif isinstance(value, int) and -2**63 <= value < 2**63:
+            value_type = self.value_type_int
+        elif isinstance(value, float):
+            value_type = self.value_type_float
+            value = int64_struct.unpack(double_struct.pack(value))[0]
+        else:
+            value_type = self.value_type_object
+            self.objects.append(value)
+            value = len(self.objects) - 1
+
+        self.names.append(self.buffer.intern_name(measurement.name))
+        self.tag_sets.append(self.buffer.intern_tag_set(measurement.tag_set))
+        self.timestamps.append(encode_timestamp(measurement.timestamp))
+        self.value_types.append(value_type)
+        self.values.append(value)
+        self.spool_segments.append(measurement.spool_segment if measurement.spool_segment is not None else -1)
+
+    def popleft(self):
+
+        if len(self) == 0:
+            raise IndexError("pop from an empty bucket")
+
+        self.start += 1
+
+    def release(self):
+        """
+        release the interned names and tag sets of all measurements ever added to this bucket
+        """
+
+        for name_id, count in Counter(self.names).items():
+            self.buffer.names.release(name_id, count)
+
+        for tag_set_id, count in Counter(self.tag_sets).items():
+            self.buffer.tag_sets.release(tag_set_id, count)
+
+    def get_measurements(self, start, stop):
+        """
+        returns the measurements from 'start' to 'stop' as list of FritzMeasurement objects
+        """
+
+        names = self.buffer.names
+        tag_sets = self.buffer.tag_sets
+
+        measurements = list()
+        for index in range(self.start + start, min(self.start + stop, len(self.timestamps))):
+
+            value_type = self.value_types[index]
+            value = self.values[index]
+            if value_type == self.value_type_bool:
+                value = bool(value)
+            elif value_type == self.value_type_float:
+                value = double_struct.unpack(int64_struct.pack(value))[0]
+            elif value_type == self.value_type_object:
+                value = self.objects[value]
+
+            measurement = FritzMeasurement(
+                names[self.names[index]], value,
+                data_type=type(value),
+                tag_set=tag_sets[self.tag_sets[index]],
+                timestamp=epoch + timedelta(microseconds=self.timestamps[index]),
+                timestamp_precision=WritePrecision.US
+            )
+
+            if self.spool_segments[index] >= 0:
+                measurement.spool_segment = self.spool_segments[index]
+
+            measurements.append(measurement)
+
+        return measurements
+
+
+class CompactMeasurementBuffer(MeasurementBuffer):
+    """
+        MeasurementBuffer which keeps the measurements of each bucket in compact columns
+        instead of FritzMeasurement objects. This reduces the memory usage of a large backlog
+        a lot. Measurements are only turned back into FritzMeasurement objects when they are read.
+
+        Names and tag sets are interned per buffer and released again once the last bucket
+        referencing them has been dropped.
+    """
+
+    def __init__(self, max_size):
+
+        super().__init__(max_size)
+
+        self.names = InternTable()
+        self.tag_sets = InternTable()
+
+    def intern_name(self, name):
+        return self.names.add(name, name)
+
+    def intern_tag_set(self, tag_set):
+        return self.tag_sets.add(tag_set.id, tag_set)
+
+    def new_bucket(self):
+        return CompactBucket(self)
+
+    def release_bucket(self, bucket):
+        bucket.release()
+
+    def slice_bucket(self, bucket, start, stop):
+        return bucket.get_measurements(start, stop)
+
+    def split_bucket(self, bucket, timestamp):
+
+        removed = list()
+        remaining_bucket = self.new_bucket()
+        for measurement in bucket:
+            if measurement.timestamp < timestamp:
+                removed.append(measurement)
+            else:
+                remaining_bucket.append(measurement)
+
+        return removed, remaining_bucket
+
+# EOF
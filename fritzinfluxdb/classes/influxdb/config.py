@@ -51,6 +51,34 @@ class InfluxDBConfig(ConfigBase):
         "type": int,
         "default": 365
     }
+    max_concurrent_writes = {
+        "type": int,
+        "default": 2
+    }
+    gzip_level = {
+        "type": int,
+        "default": 0
+    }
+    gzip_min_size = {
+        "type": int,
+        "default": 1024
+    }
+    compact_buffer = {
+        "type": bool,
+        "default": False
+    }
+    spool_directory = {
+        "type": str,
+        "default": None
+    }
+    spool_segment_size = {
+        "type": int,
+        "default": 16
+    }
+    spool_fsync_interval = {
+        "type": int,
+        "default": 5
+    }
 
     # version 1 parameters
     username = {
@@ -101,6 +129,21 @@ class InfluxDBConfig(ConfigBase):
             log.error(f"Invalid InfluxDB version '{self.version}'.")
             self.parser_error = True
 
+        if self.spool_directory is not None and len(self.spool_directory) == 0:
+            self.spool_directory = None
+
+        if self.max_concurrent_writes < 1:
+            log.info("Setting minimum of concurrent InfluxDB writes to 1")
+            self.max_concurrent_writes = 1
+
+        if not 0 <= self.gzip_level <= 9:
+            log.error(f"InfluxDB gzip level must be between 0 and 9, got '{self.gzip_level}'")
+            self.parser_error = True
+
+        if self.spool_segment_size < 1:
+            log.error(f"InfluxDB spool segment size must be at least 1 MB, got '{self.spool_segment_size}'")
+            self.parser_error = True
+
         for key in mandatory_keys:
             if getattr(self, key) is None or len(getattr(self, key)) == 0:
                 self.parser_error = True
@@ -8,12 +8,16 @@
 #  repository or visit: <https://opensource.org/licenses/MIT>.
 
 import asyncio
+import gzip
+import re
+import time
 import pytz
-from datetime import datetime
+from datetime import datetime, timedelta
 from http.client import HTTPConnection
 from logging import LogRecord
 
 import requests
+import urllib3
 
 # InfluxDB version 1.x client
 from influxdb import InfluxDBClient as InfluxDBClientV1
@@ -21,18 +25,65 @@ from influxdb.exceptions import InfluxDBClientError
 # InfluxDB version 2.x client
 from influxdb_client import InfluxDBClient as InfluxDBClientV2, BucketRetentionRules, DBRPCreate, DBRPsService
 from influxdb_client.rest import ApiException
-from influxdb_client.client.write_api import SYNCHRONOUS
+from influxdb_client.service.write_service import WriteService
 from influxdb_client.domain.write_precision import WritePrecision
 
 from fritzinfluxdb.classes.influxdb.config import InfluxDBConfig
+from fritzinfluxdb.classes.influxdb.batch_size import BatchSizeController
+from fritzinfluxdb.classes.influxdb.buffer import MeasurementBuffer, CompactMeasurementBuffer
+from fritzinfluxdb.classes.influxdb.spool import MeasurementSpool
+from fritzinfluxdb.classes.influxdb.line_protocol import LineProtocolEncoder
 from fritzinfluxdb.log import get_logger
 from fritzinfluxdb.classes.common import FritzMeasurement
 
 from fritzinfluxdb.classes.fritzbox.config import FritzBoxConfig
+from fritzinfluxdb.classes.scheduler import ServiceScheduler
 
 log = get_logger()
 
 
+def parse_duration(duration):
+    """
+    parse an InfluxDB duration string like '8760h0m0s'
+
+    Parameters
+    ----------
+    duration: str
+        the InfluxDB duration string
+
+    Returns
+    -------
+    int: duration in seconds, None if duration is undefined or invalid
+    """
+
+    if not isinstance(duration, str):
+        return None
+
+    unit_seconds = {
+        "w": 604800,
+        "d": 86400,
+        "h": 3600,
+        "m": 60,
+        "s": 1,
+        "ms": 0.001,
+        "us": 0.000001,
+        "µs": 0.000001,
+        "ns": 0.000000001
+    }
+
+    parts = re.findall(r"(\d+)([a-zµ]+)", duration)
+    if len(parts) == 0 or "".join([f"{value}{unit}" for value, unit in parts]) != duration:
+        return None
+
+    seconds = 0
+    for value, unit in parts:
+        if unit not in unit_seconds:
+            return None
+        seconds += int(value) * unit_seconds[unit]
+
+    return int(seconds)
+
+
 class InfluxHandler:
 
     name = "InfluxDB"
@@ -40,7 +91,7 @@ class InfluxHandler:
     config = None
     session_v1 = None
     session_v2 = None
-    session_v2_write_api = None
+    session_v2_write_service = None
 
     # default InfluxDB connection timeout
     connection_timeout_v1 = 2
@@ -49,8 +100,21 @@ class InfluxHandler:
     # max size of message buffer before discarding old measurements
     max_measurements_buffer_size = 1_000_000
 
+    # number of measurements written with the first InfluxDB write,
+    # the batch size is adjusted with every write based on the write latency
+    initial_measurements_per_write = 1_000
+
     # max number of measurements written with each InfluxDB write
-    max_measurements_per_write = 1_000
+    max_measurements_per_write = 100_000
+
+    # max size of the data written with each InfluxDB write in bytes
+    max_bytes_per_write = 5 * 1024 * 1024
+
+    # the batch size gets reduced if a write takes longer than this amount of seconds
+    target_write_latency = 1
+
+    # max number of measurements waiting in the shared queue before producers have to wait
+    max_queue_size = 10_000
 
     # percentage of filled buffer to start issue warnings
     max_measurements_buffer_warning = 80
@@ -68,8 +132,8 @@ class InfluxHandler:
     # set to true if connection to InfluxDB got lost
     connection_lost = False
 
-    # keep track if InfluxDB refuses to write data which is out of range
-    out_of_retention_period_range = False
+    # interval in seconds to remove measurements from the buffer which are older than the retention period
+    retention_purge_interval = 60
 
     def __init__(self, config, user_agent=None):
 
@@ -77,13 +141,40 @@ class InfluxHandler:
         self.version = str(self.config.version)
         self.init_successful = False
 
-        self.buffer = list()
+        if self.config.compact_buffer is True:
+            self.buffer = CompactMeasurementBuffer(self.max_measurements_buffer_size)
+        else:
+            self.buffer = MeasurementBuffer(self.max_measurements_buffer_size)
+        self.line_protocol_encoder = LineProtocolEncoder(self.config.measurement_name)
+
+        self.spool = None
+        if self.config.spool_directory is not None:
+            try:
+                self.spool = MeasurementSpool(self.config.spool_directory, self.config.measurement_name,
+                                              self.config.spool_segment_size * 1024 * 1024,
+                                              self.config.spool_fsync_interval)
+            except OSError as e:
+                log.error(f"Unable to open InfluxDB spool directory '{self.config.spool_directory}': {e}")
+                self.config.parser_error = True
 
         self.current_retry_interval = self.retry_interval
         self.last_write_retry = None
+
+        # retention period of the database/bucket, None if unknown or infinite
+        self.retention_period = None
+        self.last_retention_purge = None
         self.session_v1_requests_session = requests.Session()
+
+        # keep enough connections alive to serve all concurrent writes
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.config.max_concurrent_writes)
+        self.session_v1_requests_session.mount("http://", adapter)
+        self.session_v1_requests_session.mount("https://", adapter)
+
         self.current_max_measurements_buffer_warning = self.max_measurements_buffer_warning
-        self.current_measurements_per_write = self.max_measurements_per_write
+        self.batch_size = BatchSizeController(self.initial_measurements_per_write,
+                                              self.max_measurements_per_write,
+                                              self.max_bytes_per_write,
+                                              self.target_write_latency)
 
         if self.config.version == 1:
 
@@ -156,10 +247,13 @@ class InfluxHandler:
             # check status on influxdb buckets, if possible
             self.check_bucket_status()
 
-            self.session_v2_write_api = self.session_v2.write_api(write_options=SYNCHRONOUS)
+            self.session_v2_write_service = WriteService(self.session_v2.api_client)
 
     def close(self):
 
+        if self.spool is not None:
+            self.spool.close()
+
         if self.session_v1 is not None:
             self.session_v1.close()
             log.info("Closed InfluxDB session")
@@ -219,6 +313,18 @@ class InfluxHandler:
                 )
             except Exception as e:
                 log.warning(f"Problem creating database retention policy: {e}")
+            else:
+                retention_policies = [{
+                    "duration": f"{self.config.data_retention_days * 24}h0m0s",
+                    "shardGroupDuration": "24h0m0s",
+                    "default": True
+                }]
+
+        # measurements are written to the default retention policy
+        for retention_policy in retention_policies:
+            if retention_policy.get("default") is True:
+                self.set_retention_period(parse_duration(retention_policy.get("duration")),
+                                          parse_duration(retention_policy.get("shardGroupDuration")))
 
         log.info(f"Connection to InfluxDB {self.version} established and database present")
 
@@ -274,6 +380,12 @@ class InfluxHandler:
 
             log.info(f"Successfully create InfluxDB bucket '{self.config.bucket}'")
 
+        if bucket_data is not None:
+            for retention_rule in bucket_data.retention_rules or list():
+                if retention_rule.type == "expire":
+                    self.set_retention_period(retention_rule.every_seconds,
+                                              retention_rule.shard_group_duration_seconds)
+
         # create new bucket
         if bucket_data is not None:
             log.debug(f"InfluxDB bucket '{self.config.bucket}' present, checking database name mapping")
@@ -312,18 +424,31 @@ class InfluxHandler:
 
         self.init_successful = True
 
-    def convert_measurement(self, measurement):
+    def set_retention_period(self, duration, shard_group_duration=None):
+        """
+        set the retention period which is used to purge measurements before they are written
+
+        InfluxDB only refuses measurements if their whole shard group is older than the retention period.
+        So the shard group duration is added to the retention period to only purge measurements
+        which would be refused for sure.
 
-        if not isinstance(measurement, FritzMeasurement):
-            log.error(f"Measurement needs to be a 'FritzMeasurement' but got '{type(measurement)}'")
+        Parameters
+        ----------
+        duration: int
+            retention duration in seconds, 0 or None means infinite
+        shard_group_duration: int
+            shard group duration in seconds
+        """
+
+        if not duration:
+            log.debug("InfluxDB retention period is infinite")
+            self.retention_period = None
             return
 
-        return {
-            "measurement": self.config.measurement_name,
-            "tags": measurement.tags,
-            "time": measurement.timestamp,
-            "fields": {measurement.name: measurement.value}
-        }
+        self.retention_period = timedelta(seconds=duration + (shard_group_duration or 0))
+
+        log.debug(f"Purging measurements older than {self.retention_period} "
+                  f"according to the InfluxDB retention period")
 
     def permitted_to_write_data(self):
 
@@ -341,129 +466,263 @@ class InfluxHandler:
 
         return False
 
-    async def write_data(self):
+    def send_data(self, data):
+        """
+        send line protocol data to InfluxDB. Data gets gzip compressed if compression
+        is enabled and the size of the data reaches the configured minimum size.
 
-        if self.permitted_to_write_data() is False:
-            return
+        Parameters
+        ----------
+        data: bytes
+            the line protocol data to write
+        """
 
-        if len(self.buffer) == 0:
-            log.debug("InfluxDB data queue: No measurements found in queue")
-            return
+        content_encoding = "identity"
+        if self.config.gzip_level > 0 and len(data) >= self.config.gzip_min_size:
+            log.debug(f"Compressing {len(data)} bytes of InfluxDB write data")
+            data = gzip.compress(data, compresslevel=self.config.gzip_level)
+            content_encoding = "gzip"
 
-        if self.out_of_retention_period_range is True:
+        if self.config.version == 1:
+            headers = {
+                "Content-Type": "application/octet-stream",
+                "Accept": "text/plain"
+            }
+            if content_encoding == "gzip":
+                headers["Content-Encoding"] = content_encoding
+
+            self.session_v1.request(url="write", method="POST",
+                                    params={"db": self.config.database, "precision": "u"},
+                                    data=data, expected_response_code=204, headers=headers)
+
+        elif self.config.version == 2:
+            self.session_v2_write_service.post_write(org=self.config.organisation, bucket=self.config.bucket,
+                                                     body=data, precision=WritePrecision.US,
+                                                     content_encoding=content_encoding,
+                                                     content_type="text/plain; charset=utf-8")
 
-            # sort measurements to write out all the newest measurements first
-            # which probably won't hit the retention period boundary
-            self.buffer = sorted(self.buffer, key=lambda m: m.timestamp, reverse=True)
+    async def write_data(self):
+        """
+        write measurements from the buffer to InfluxDB.
 
-        # only use max amount of measurements to send to InfluxDB
-        log.debug(f"Trying to write a maximum of '{self.current_measurements_per_write}' measurements to InfluxDB")
-        local_buffer = self.buffer[0:self.current_measurements_per_write]
+        Up to 'max_concurrent_writes' batches are written at the same time in the default
+        thread pool executor, this way the event loop is never blocked by a slow InfluxDB.
+        Batches are acknowledged in order: measurements are only removed from the buffer
+        if their batch and all batches before have been written successfully.
 
-        # convert FritzMeasurement to list of dicts
-        data = [self.convert_measurement(x) for x in local_buffer]
+        Returns
+        -------
+        bool: True if all batches have been written successfully
+        """
 
-        write_successful = False
-        self.last_write_retry = datetime.now(pytz.utc)
-        try:
-            if self.config.version == 1:
-                write_successful = self.session_v1.write_points(data, time_precision="u")
-            elif self.config.version == 2:
-                self.session_v2_write_api.write(bucket=self.config.bucket, record=data,
-                                                write_precision=WritePrecision.US)
-                write_successful = True
-        except (ApiException, InfluxDBClientError) as e:
-
-            exception_message = None
-            http_code = 0
-            if isinstance(e, ApiException):
-                http_code = e.status
-                exception_message = e.message
-            if isinstance(e, InfluxDBClientError):
-                http_code = e.code
-                exception_message = e.content
-
-            if exception_message is None:
-                exception_message = str(e)
-
-            if "points beyond retention policy" in f"{exception_message}":
-
-                log.debug("InfluxDB refused to write data as there seems to be measurements "
-                          "which are older then the defined retention period")
-
-                self.out_of_retention_period_range = True
-                self.current_retry_interval = 0
-
-                # get timestamp of measurement which is just out of range
-                if self.current_measurements_per_write <= 1 and len(self.buffer) > 0:
-                    newest_measurement = self.buffer[0]
-                    num_purged = len([x for x in self.buffer if x.timestamp <= newest_measurement.timestamp])
-                    log.info(f"Purging '{num_purged}' measurements which are older ({newest_measurement.timestamp}) "
-                             f"then the InfluxDB configured retention period")
-                    for entry in self.buffer:
-                        if entry.timestamp <= newest_measurement.timestamp:
-                            log.debug(f"Dropped measurement: {entry}")
-                    self.buffer[:] = [x for x in self.buffer if x.timestamp > newest_measurement.timestamp]
-                else:
-                    self.set_num_current_measurements_to_write(int(self.current_measurements_per_write/2))
-            else:
-                log.error(f"Failed to write to InfluxDB '{self.config.hostname}': {http_code}: {exception_message}")
+        if self.permitted_to_write_data() is False:
+            return False
 
-        except Exception as e:
-            self.connection_lost = True
-            log.error(f"Failed to write to InfluxDB '{self.config.hostname}': {e}")
+        # drop measurements which InfluxDB would refuse anyway
+        self.purge_expired_measurements()
 
         if len(self.buffer) == 0:
-            self.out_of_retention_period_range = False
-            self.current_measurements_per_write = self.max_measurements_per_write
+            log.debug("InfluxDB data queue: No measurements found in queue")
+            return False
+
+        # only use max amount of measurements to send to InfluxDB with each batch
+        log.debug(f"Trying to write a maximum of '{self.config.max_concurrent_writes}' batches with "
+                  f"'{self.batch_size.size}' measurements each to InfluxDB")
+
+        batches = list()
+        for batch_num in range(self.config.max_concurrent_writes):
+            batch = self.buffer.get_batch(self.batch_size.size, offset=batch_num * self.batch_size.size)
+            if len(batch) == 0:
+                break
+            batches.append(batch)
 
-        if write_successful is True:
+        # convert FritzMeasurement lists to line protocol
+        payloads = [self.line_protocol_encoder.encode_batch(batch) for batch in batches]
+
+        # write all batches at once
+        loop = asyncio.get_running_loop()
+        self.last_write_retry = datetime.now(pytz.utc)
+        write_start = time.monotonic()
+        results = await asyncio.gather(
+            *[loop.run_in_executor(None, self.send_data, payload) for payload in payloads],
+            return_exceptions=True
+        )
+        write_latency = time.monotonic() - write_start
+
+        written_batches = list()
+        num_written_measurements = 0
+        num_written_bytes = 0
+        num_dropped_measurements = 0
+        # measurements and bytes of the largest written batch, used to adjust the batch size
+        largest_batch = (0, 0)
+        write_error = None
+        for batch, payload, result in zip(batches, payloads, results):
+            if isinstance(result, Exception):
+
+                # InfluxDB only refused the measurements beyond the retention period, all others have been written
+                num_dropped = self.get_num_dropped_by_retention_policy(result)
+                if num_dropped is None:
+                    write_error = result
+                    break
+
+                num_dropped_measurements += num_dropped
+
+            written_batches.append(batch)
+            num_written_measurements += len(batch)
+            num_written_bytes += len(payload)
+            largest_batch = max(largest_batch, (len(batch), len(payload)))
+
+        if num_dropped_measurements > 0:
+            log.info(f"InfluxDB dropped '{num_dropped_measurements}' measurements which are "
+                     f"older then the InfluxDB configured retention period")
+
+            # purge all other expired measurements from the buffer right away
+            self.last_retention_purge = None
+
+        if num_written_measurements > 0:
             if self.connection_lost is True:
                 log.info(f"Connection to influxDB '{self.config.hostname}' restored.")
                 log.info(f"Flushing '{len(self.buffer)}' measurements to InfluxDB")
 
-            log.debug(f"Successfully wrote {len(local_buffer)} measurements to InfluxDB")
-            self.buffer[:] = [x for x in self.buffer if x not in local_buffer]
+            log.debug(f"Successfully wrote {num_written_measurements} measurements ({num_written_bytes} bytes) "
+                      f"to InfluxDB in {write_latency:0.3f} seconds")
+            self.buffer.remove_batch(num_written_measurements)
+
+            if self.spool is not None:
+                for batch in written_batches:
+                    self.spool.acknowledge(batch)
 
             self.connection_lost = False
             self.last_write_retry = None
             self.current_retry_interval = self.retry_interval
 
-            self.out_of_retention_period_range = False
-            self.set_num_current_measurements_to_write(self.current_measurements_per_write * 4)
+            self.batch_size.write_succeeded(*largest_batch, write_latency)
+
+        if write_error is not None:
+            self.handle_write_error(write_error)
 
-        else:
             if self.connection_lost is True:
                 self.current_retry_interval *= 2
 
-    def set_num_current_measurements_to_write(self, num_measurements: int):
+        return write_error is None
+
+    @staticmethod
+    def get_write_error_details(write_error):
+        """
+        returns the HTTP status code and the message of an InfluxDB client exception
+        """
+
+        exception_message = None
+        http_code = 0
+        if isinstance(write_error, ApiException):
+            http_code = write_error.status
+            exception_message = write_error.message
+        if isinstance(write_error, InfluxDBClientError):
+            http_code = write_error.code
+            exception_message = write_error.content
+
+        if exception_message is None:
+            exception_message = str(write_error)
+
+        return http_code, f"{exception_message}"
+
+    def get_num_dropped_by_retention_policy(self, write_error):
+        """
+        InfluxDB writes all measurements of a batch which are within the retention period
+        and drops the ones which are older (partial write).
+
+        Parameters
+        ----------
+        write_error: Exception
+            the exception raised by 'send_data'
+
+        Returns
+        -------
+        int: number of dropped measurements or None if the write error wasn't caused by the retention policy
+        """
+
+        if not isinstance(write_error, (ApiException, InfluxDBClientError)):
+            return None
 
-        if not isinstance(num_measurements, int):
+        _, exception_message = self.get_write_error_details(write_error)
+
+        if "points beyond retention policy" not in exception_message:
+            return None
+
+        num_dropped = re.search(r"dropped=(\d+)", exception_message)
+
+        return int(num_dropped.group(1)) if num_dropped is not None else 0
+
+    def handle_write_error(self, write_error):
+        """
+        handle an exception raised while writing a batch to InfluxDB
+
+        Parameters
+        ----------
+        write_error: Exception
+            the exception raised by 'send_data'
+        """
+
+        if not isinstance(write_error, (ApiException, InfluxDBClientError)):
+            self.connection_lost = True
+            log.error(f"Failed to write to InfluxDB '{self.config.hostname}': {write_error}")
+
+            # the batch might have been too large to be written in time
+            if isinstance(write_error, (requests.exceptions.Timeout, urllib3.exceptions.TimeoutError)):
+                self.batch_size.write_failed()
             return
 
-        if num_measurements < 1:
-            self.current_measurements_per_write = 1
-        elif num_measurements >= self.max_measurements_per_write:
-            self.current_measurements_per_write = self.max_measurements_per_write
-        else:
-            self.current_measurements_per_write = num_measurements
+        http_code, exception_message = self.get_write_error_details(write_error)
+
+        log.error(f"Failed to write to InfluxDB '{self.config.hostname}': {http_code}: {exception_message}")
+
+    def purge_expired_measurements(self):
+        """
+        remove all measurements from the buffer which are older than the retention period of
+        the database/bucket. This is done at most every 'retention_purge_interval' seconds.
+        """
+
+        if self.retention_period is None:
+            return
+
+        if self.last_retention_purge is not None and \
+                time.monotonic() - self.last_retention_purge < self.retention_purge_interval:
+            return
+
+        self.last_retention_purge = time.monotonic()
+
+        oldest_permitted_timestamp = datetime.now(pytz.utc) - self.retention_period
+        purged_measurements = self.buffer.remove_older_than(oldest_permitted_timestamp)
+
+        if len(purged_measurements) == 0:
+            return
+
+        if self.spool is not None:
+            self.spool.acknowledge(purged_measurements)
+
+        log.info(f"Purging '{len(purged_measurements)}' measurements which are older "
+                 f"({oldest_permitted_timestamp}) then the InfluxDB configured retention period")
+        for entry in purged_measurements:
+            log.debug(f"Dropped measurement: {entry}")
 
     async def check_buffer(self):
 
         length = len(self.buffer)
         max_length = self.max_measurements_buffer_size
 
+        # the buffer discards the oldest measurements by itself if it is full
+        num_discarded = self.buffer.pop_num_discarded()
+
         percent_buffer_usage = 100 / max_length * length
 
         buffer_warning_message = f"InfluxDB measurement buffer currently at {percent_buffer_usage:0.2f}% " \
                                  f"(current {length}/max {max_length}). If buffer is full the oldest " \
                                  f"messages will be discarded."
 
-        if length > max_length:
-            log.critical(f"InfluxDB measurement buffer length '{length}' "
+        if num_discarded > 0:
+            log.critical(f"InfluxDB measurement buffer length '{length + num_discarded}' "
                          f"exceeded the maximum of {max_length} items. "
-                         f"Discarding oldest {length - max_length} measurements.")
-            self.buffer[:] = self.buffer[0 - max_length:]
+                         f"Discarded oldest {num_discarded} measurements.")
 
         elif percent_buffer_usage >= self.current_max_measurements_buffer_warning:
             log.warning(buffer_warning_message)
@@ -471,22 +730,80 @@ class InfluxHandler:
         elif percent_buffer_usage < self.max_measurements_buffer_warning:
             self.current_max_measurements_buffer_warning = self.max_measurements_buffer_warning
 
+    def add_measurement(self, measurement):
+        """
+        add a measurement to the buffer and to the spool if enabled
+        """
+
+        if self.spool is None:
+            self.buffer.append(measurement)
+            return
+
+        # if the buffer is full, measurements are only kept in the spool until the buffer has been written
+        loaded = self.spool.num_unloaded == 0 and len(self.buffer) < self.max_measurements_buffer_size
+
+        try:
+            self.spool.append(measurement, loaded=loaded)
+        except OSError as e:
+            log.error(f"Unable to write measurement to InfluxDB spool: {e}")
+            loaded = True
+
+        if loaded is True:
+            self.buffer.append(measurement)
+
+    async def refill_buffer_from_spool(self):
+        """
+        acknowledge all spooled measurements once the buffer has been written completely
+        and load measurements which have only been kept in the spool
+        """
+
+        if self.spool is None or len(self.buffer) > 0:
+            return
+
+        self.spool.acknowledge_all()
+
+        try:
+            measurements = await asyncio.get_running_loop().run_in_executor(
+                None, self.spool.load, self.max_measurements_buffer_size)
+        except OSError as e:
+            log.error(f"Unable to read measurements from InfluxDB spool: {e}")
+            return
+
+        if len(measurements) > 0:
+            log.info(f"Loaded '{len(measurements)}' measurements from InfluxDB spool")
+
+        for measurement in measurements:
+            self.buffer.append(measurement)
+
     async def task_loop(self, queue):
 
         while True:
 
+            await self.refill_buffer_from_spool()
+
             # transfer items to instance buffer
             while queue.empty() is False:
                 # add measurements to instance buffer
-                self.buffer.append(await queue.get())
+                self.add_measurement(await queue.get())
+
+            # trim, rotate and sync the spool without blocking the event loop
+            if self.spool is not None:
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, self.spool.maintain)
+                except OSError as e:
+                    log.error(f"Unable to sync InfluxDB spool to disk: {e}")
 
             # write data from buffer to InfluxDB
-            await self.write_data()
+            write_successful = await self.write_data()
             await self.check_buffer()
 
             log.debug(f"Current InfluxDB measurement buffer length: {len(self.buffer)}")
-            if self.out_of_retention_period_range is False:
-                await asyncio.sleep(1)
+
+            # keep on writing right away if there is still a backlog which InfluxDB accepts
+            if write_successful is True and len(self.buffer) > 0:
+                continue
+
+            await asyncio.sleep(1)
 
 
 class InfluxLogAndConfigWriter:
@@ -540,8 +857,6 @@ class InfluxLogAndConfigWriter:
         self.config = config
         self.log_queue = log_queue
 
-        self.last_timezone_setting_write = None
-
         self.init_successful = True
 
     def format_log_record(self, log_record):
@@ -568,23 +883,38 @@ class InfluxLogAndConfigWriter:
                                 box_tag=self.config.box_tag,
                                 data_type=str)
 
-    def is_time_to_write_timezone_setting(self):
+    async def task_loop(self, output_queue: asyncio.Queue):
 
-        if self.last_timezone_setting_write is None:
-            return True
+        scheduler = ServiceScheduler()
 
-        if (datetime.now(pytz.utc) - self.last_timezone_setting_write).total_seconds() >= \
-                self.timezone_setting_write_interval:
-            return True
+        # write timezone setting to influx queue right away and then in the defined interval
+        scheduler.add(self.timezone_measurement_name, self.timezone_setting_write_interval)
 
-        return False
+        # the pending 'get()' is kept across iterations, cancelling it on a timeout could drop a log record
+        get_log_record = None
 
-    async def task_loop(self, output_queue: asyncio.Queue):
+        try:
+            while True:
 
-        while True:
+                for scheduled_item in scheduler.pop_due_items():
+                    timezone_measurement = self.get_timezone_setting_measurement()
+                    log.debug(timezone_measurement)
+                    await output_queue.put(timezone_measurement)
+                    scheduler.reschedule(scheduled_item)
 
-            while self.log_queue.empty() is False:
-                formatted_log_record = self.format_log_record(await self.log_queue.get())
+                if get_log_record is None:
+                    get_log_record = asyncio.ensure_future(self.log_queue.get())
+
+                # wait for new log records until the timezone setting needs to be written again
+                await asyncio.wait({get_log_record}, timeout=scheduler.seconds_until_next())
+
+                if get_log_record.done() is False:
+                    continue
+
+                log_record = get_log_record.result()
+                get_log_record = None
+
+                formatted_log_record = self.format_log_record(log_record)
 
                 if formatted_log_record is None:
                     continue
@@ -592,14 +922,8 @@ class InfluxLogAndConfigWriter:
                 log.debug(formatted_log_record)
 
                 await output_queue.put(formatted_log_record)
-
-            # write timezone setting to influx queue
-            if self.is_time_to_write_timezone_setting():
-                timezone_measurement = self.get_timezone_setting_measurement()
-                log.debug(timezone_measurement)
-                await output_queue.put(timezone_measurement)
-                self.last_timezone_setting_write = datetime.now(pytz.utc)
-
-            await asyncio.sleep(1)
+        finally:
+            if get_log_record is not None:
+                get_log_record.cancel()
 
 # EOF
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+"""
+    Encoder and decoder for InfluxDB line protocol
+    https://docs.influxdata.com/influxdb/v2.1/reference/syntax/line-protocol/
+
+    Timestamps are always written with microsecond precision. Newlines in keys and values
+    are escaped as '\\n', this way every measurement is always exactly one line.
+"""
+
+import pytz
+from datetime import datetime, timedelta
+
+from fritzinfluxdb.classes.common import FritzMeasurement, WritePrecision
+
+epoch = datetime(1970, 1, 1, tzinfo=pytz.utc)
+
+escape_measurement_table = str.maketrans({"\\": "\\\\", ",": "\\,", " ": "\\ ", "\n": "\\n"})
+escape_key_table = str.maketrans({"\\": "\\\\", ",": "\\,", " ": "\\ ", "=": "\\=", "\n": "\\n"})
+escape_string_table = str.maketrans({"\\": "\\\\", '"': '\\"', "\n": "\\n"})
+
+
+def escape_key(value):
+    return f"{value}".translate(escape_key_table)
+
+
+def encode_value(value):
+    """
+    returns a measurement value formatted as line protocol field value
+    """
+
+    if isinstance(value, bool):
+        return "true" if value is True else "false"
+    if isinstance(value, int):
+        return f"{value}i"
+    if isinstance(value, float):
+        return repr(value)
+
+    return f'"{f"{value}".translate(escape_string_table)}"'
+
+
+def encode_timestamp(timestamp):
+    """
+    returns a timezone aware datetime object as microseconds since epoch
+    """
+
+    return int(timestamp.timestamp()) * 1_000_000 + timestamp.microsecond
+
+
+def encode_tags(tags):
+    """
+    returns a dict of tags as line protocol tag set including the leading comma
+    """
+
+    tag_set = ""
+
+    # tags with empty values are not permitted, sorted tags are processed faster by InfluxDB
+    for key, value in sorted(tags.items()):
+        if value is None or f"{value}" == "":
+            continue
+        tag_set += f",{escape_key(key)}={escape_key(value)}"
+
+    return tag_set
+
+
+class LineProtocolEncoder:
+    """
+        Encodes FritzMeasurement objects directly to line protocol.
+
+        The escaped tag string is stored with the interned tag set of the measurements
+        and every escaped field key is cached, as these repeat in every poll cycle.
+    """
+
+    def __init__(self, measurement_name):
+        """
+        Parameters
+        ----------
+        measurement_name: str
+            the InfluxDB measurement name
+        """
+
+        self.escaped_measurement_name = f"{measurement_name}".translate(escape_measurement_table)
+
+        self._field_key_cache = dict()
+
+    @staticmethod
+    def get_tag_set(measurement):
+
+        tag_set = measurement.tag_set
+        if tag_set.line_protocol is None:
+            tag_set.line_protocol = encode_tags(tag_set.tags)
+
+        return tag_set.line_protocol
+
+    def get_field_key(self, name):
+
+        field_key = self._field_key_cache.get(name)
+        if field_key is None:
+            field_key = self._field_key_cache[name] = escape_key(name)
+
+        return field_key
+
+    def encode(self, measurement):
+        """
+        encode a FritzMeasurement as single line protocol line (without trailing newline)
+
+        Parameters
+        ----------
+        measurement: FritzMeasurement
+            the measurement to encode
+
+        Returns
+        -------
+        str: line protocol line
+        """
+
+        return f"{self.escaped_measurement_name}{self.get_tag_set(measurement)} " \
+               f"{self.get_field_key(measurement.name)}={encode_value(measurement.value)} " \
+               f"{encode_timestamp(measurement.timestamp)}"
+
+    def encode_batch(self, measurements):
+        """
+        encode a list of FritzMeasurement objects as line protocol request body
+
+        Measurements which share tag set and timestamp (i.e. all values of a single
+        service request) are coalesced into one line with multiple fields. If the
+        same field is contained more than once, the last value wins, just like
+        InfluxDB would handle separate points.
+
+        Parameters
+        ----------
+        measurements: list
+            list of FritzMeasurement objects
+
+        Returns
+        -------
+        bytes: utf-8 encoded line protocol lines
+        """
+
+        get_tag_set = self.get_tag_set
+        get_field_key = self.get_field_key
+
+        # dicts keep insertion order, so lines are written in order of the first measurement of each point
+        points = dict()
+        for measurement in measurements:
+            point_key = (get_tag_set(measurement), encode_timestamp(measurement.timestamp))
+
+            fields = points.get(point_key)
+            if fields is None:
+                fields = points[point_key] = dict()
+
+            fields[get_field_key(measurement.name)] = encode_value(measurement.value)
+
+        measurement_name = self.escaped_measurement_name
+
+        return "\n".join([
+            f"{measurement_name}{tag_set} "
+            f"{','.join([f'{key}={value}' for key, value in fields.items()])} {timestamp}"
+            for (tag_set, timestamp), fields in points.items()
+        ]).encode("utf-8")
+
+
+def find_unescaped(text, characters, start=0):
+    """
+    returns position of the first of the characters which is not escaped by a backslash or -1 if not found
+    """
+
+    position = start
+    while position < len(text):
+        if text[position] == "\\":
+            position += 2
+            continue
+        if text[position] in characters:
+            return position
+        position += 1
+
+    return -1
+
+
+def split_unescaped(text, character):
+
+    parts = list()
+    start = 0
+    while True:
+        position = find_unescaped(text, character, start)
+        if position < 0:
+            parts.append(text[start:])
+            return parts
+        parts.append(text[start:position])
+        start = position + 1
+
+
+def unescape(text):
+
+    if "\\" not in text:
+        return text
+
+    result = list()
+    position = 0
+    while position < len(text):
+        if text[position] == "\\" and position + 1 < len(text):
+            result.append("\n" if text[position + 1] == "n" else text[position + 1])
+            position += 2
+        else:
+            result.append(text[position])
+            position += 1
+
+    return "".join(result)
+
+
+def decode_value(value):
+
+    if value.startswith('"'):
+        return unescape(value[1:-1])
+    if value == "true":
+        return True
+    if value == "false":
+        return False
+    if value.endswith("i"):
+        return int(value[:-1])
+
+    return float(value)
+
+
+def decode_measurement(line):
+    """
+    decode a single line protocol line, which was encoded by the LineProtocolEncoder, back to a FritzMeasurement
+
+    Parameters
+    ----------
+    line: str
+        line protocol line
+
+    Returns
+    -------
+    FritzMeasurement: the decoded measurement
+
+    Raises
+    ------
+    ValueError: if the line can't be parsed
+    """
+
+    line = line.rstrip("\n")
+
+    # timestamp is always the last element and never contains a space
+    line, _, timestamp = line.rpartition(" ")
+
+    series_end = find_unescaped(line, " ")
+    if series_end < 0 or len(timestamp) == 0:
+        raise ValueError(f"invalid line protocol line: {line}")
+
+    tags = dict()
+    for tag in split_unescaped(line[:series_end], ",")[1:]:
+        key_end = find_unescaped(tag, "=")
+        if key_end < 0:
+            raise ValueError(f"invalid line protocol tag: {tag}")
+        tags[unescape(tag[:key_end])] = unescape(tag[key_end + 1:])
+
+    field = line[series_end + 1:]
+    key_end = find_unescaped(field, "=")
+    if key_end < 0:
+        raise ValueError(f"invalid line protocol field: {field}")
+
+    value = decode_value(field[key_end + 1:])
+
+    return FritzMeasurement(unescape(field[:key_end]), value,
+                            data_type=type(value),
+                            box_tag=tags.pop(FritzMeasurement.default_box_tag_key, None),
+                            additional_tags=tags if len(tags) > 0 else None,
+                            timestamp=epoch + timedelta(microseconds=int(timestamp)),
+                            timestamp_precision=WritePrecision.US)
+
+# EOF
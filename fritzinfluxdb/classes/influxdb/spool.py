@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import os
+import time
+
+from fritzinfluxdb.log import get_logger
+from fritzinfluxdb.classes.influxdb.line_protocol import LineProtocolEncoder, decode_measurement
+
+log = get_logger()
+
+
+class MeasurementSpool:
+    """
+        Append only on-disk spool for measurements which have not been written to InfluxDB yet.
+
+        Every measurement is appended to the current segment file as line protocol line.
+        Segments are rotated once they reach the configured size.
+
+        The in memory buffer of the InfluxHandler always holds a consecutive range of spooled
+        measurements. The read position points to the first spooled measurement which has not
+        been loaded into the memory buffer. If the memory buffer is full, new measurements are
+        only kept on disk and are loaded once the memory buffer has been written to InfluxDB.
+
+        For every segment the number of measurements which are loaded into the memory buffer
+        but haven't been written yet is tracked. Every loaded measurement carries its segment
+        in 'spool_segment', and gets acknowledged as soon as its batch has been written (or it
+        has been purged). Segments which have been read completely and have no pending
+        measurements left are removed from disk.
+
+        Disk I/O which may block (syncing, rotating, trimming and loading) is meant to be run
+        in an executor by the InfluxHandler.
+    """
+
+    segment_file_prefix = "segment-"
+    segment_file_suffix = ".lp"
+
+    def __init__(self, directory, measurement_name, segment_size, fsync_interval):
+        """
+        Parameters
+        ----------
+        directory: str
+            path to the spool directory, will be created if it doesn't exist
+        measurement_name: str
+            the InfluxDB measurement name used to encode measurements
+        segment_size: int
+            max size of a single segment file in bytes
+        fsync_interval: int
+            max number of seconds between syncing spool data to disk
+        """
+
+        self.directory = directory
+        self.encoder = LineProtocolEncoder(measurement_name)
+        self.segment_size = segment_size
+        self.fsync_interval = fsync_interval
+
+        # number of spooled measurements which have not been loaded into memory
+        self.num_unloaded = 0
+
+        self.segments = list()
+        self.read_segment = None
+        self.read_offset = 0
+        self.last_fsync = time.monotonic()
+        self.unsynced_data = False
+
+        # segment -> number of loaded measurements which have not been acknowledged yet
+        self.pending = dict()
+
+        self._file = None
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        for file_name in os.listdir(self.directory):
+            if file_name.startswith(self.segment_file_prefix) and file_name.endswith(self.segment_file_suffix):
+                try:
+                    self.segments.append(
+                        int(file_name[len(self.segment_file_prefix):-len(self.segment_file_suffix)])
+                    )
+                except ValueError:
+                    continue
+
+        self.segments.sort()
+
+        for segment in self.segments:
+            self.num_unloaded += self.repair_segment(segment)
+
+        if len(self.segments) == 0:
+            self.segments.append(0)
+
+        self.read_segment = self.segments[0]
+        self._file = open(self.segment_path(self.segments[-1]), "ab")
+
+        if self.num_unloaded > 0:
+            log.info(f"Found '{self.num_unloaded}' measurements in InfluxDB spool '{self.directory}' to replay")
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, f"{self.segment_file_prefix}{segment:010d}{self.segment_file_suffix}")
+
+    def repair_segment(self, segment):
+        """
+        remove an incomplete last line (i.e. after a crash) and return the number of lines in the segment
+        """
+
+        with open(self.segment_path(segment), "rb+") as segment_file:
+            data = segment_file.read()
+            valid_length = data.rfind(b"\n") + 1
+            if valid_length != len(data):
+                log.warning(f"Removing incomplete measurement from InfluxDB spool segment "
+                            f"'{self.segment_path(segment)}'")
+                segment_file.truncate(valid_length)
+
+        return data.count(b"\n", 0, valid_length)
+
+    def append(self, measurement, loaded=True):
+        """
+        append a measurement to the spool
+
+        Parameters
+        ----------
+        measurement: FritzMeasurement
+            the measurement to append
+        loaded: bool
+            True if the measurement has also been added to the memory buffer
+        """
+
+        self._file.write(f"{self.encoder.encode(measurement)}\n".encode("utf-8"))
+        self.unsynced_data = True
+
+        if loaded is True and self.num_unloaded == 0:
+            self.read_segment = self.segments[-1]
+            self.read_offset = self._file.tell()
+            self.add_pending(measurement, self.read_segment)
+        else:
+            self.num_unloaded += 1
+
+    def add_pending(self, measurement, segment):
+
+        measurement.spool_segment = segment
+        self.pending[segment] = self.pending.get(segment, 0) + 1
+
+    def rotate(self, force=False):
+        """
+        start a new segment once the current segment reached the segment size
+        """
+
+        if force is False and self._file.tell() < self.segment_size:
+            return
+
+        self.sync(force=True)
+        self._file.close()
+
+        self.segments.append(self.segments[-1] + 1)
+        self._file = open(self.segment_path(self.segments[-1]), "ab")
+
+    def load(self, max_measurements):
+        """
+        load spooled measurements which are not loaded into memory yet, starting at the read position
+
+        Parameters
+        ----------
+        max_measurements: int
+            max number of measurements to load
+
+        Returns
+        -------
+        list: of FritzMeasurement
+        """
+
+        measurements = list()
+
+        if self.num_unloaded == 0:
+            return measurements
+
+        self._file.flush()
+
+        while len(measurements) < max_measurements and self.num_unloaded > 0:
+
+            with open(self.segment_path(self.read_segment), "rb") as segment_file:
+                segment_file.seek(self.read_offset)
+
+                for line in segment_file:
+                    if len(measurements) >= max_measurements:
+                        break
+
+                    self.read_offset += len(line)
+                    self.num_unloaded -= 1
+
+                    try:
+                        measurement = decode_measurement(line.decode("utf-8"))
+                    except Exception as e:
+                        log.warning(f"Unable to parse measurement from InfluxDB spool: {e}")
+                        continue
+
+                    measurements.append(measurement)
+                    self.add_pending(measurement, self.read_segment)
+
+            if len(measurements) < max_measurements and self.read_segment != self.segments[-1]:
+                self.read_segment = self.segments[self.segments.index(self.read_segment) + 1]
+                self.read_offset = 0
+            elif len(measurements) < max_measurements:
+                # reached end of spool
+                self.num_unloaded = 0
+
+        return measurements
+
+    def acknowledge(self, measurements):
+        """
+        acknowledge measurements which have been removed from the memory buffer,
+        i.e. after they have been written successfully
+
+        Parameters
+        ----------
+        measurements: list
+            list of FritzMeasurement
+        """
+
+        for measurement in measurements:
+            segment = measurement.spool_segment
+            if segment is None or segment not in self.pending:
+                continue
+
+            measurement.spool_segment = None
+
+            self.pending[segment] -= 1
+            if self.pending[segment] <= 0:
+                del self.pending[segment]
+
+    def acknowledge_all(self):
+        """
+        acknowledge all loaded measurements.
+        Must only be called if all measurements from the memory buffer have been handled.
+        """
+
+        self.pending = dict()
+
+    def trim(self):
+        """
+        remove all segments which have been read completely and have no pending measurements
+        """
+
+        for segment in [x for x in self.segments if x < self.read_segment and x not in self.pending]:
+            try:
+                os.remove(self.segment_path(segment))
+            except OSError as e:
+                log.error(f"Unable to remove InfluxDB spool segment '{self.segment_path(segment)}': {e}")
+            self.segments.remove(segment)
+
+        # current segment has been read completely, start over with an empty segment
+        if self.num_unloaded == 0 and self.read_offset > 0 and self.read_segment == self.segments[-1] and \
+                self.read_segment not in self.pending:
+            self._file.truncate(0)
+            self._file.seek(0)
+            self.read_offset = 0
+
+    def maintain(self):
+        """
+        remove acknowledged segments, rotate the current segment if necessary and sync data to disk
+        """
+
+        self.trim()
+        self.rotate()
+        self.sync()
+
+    def sync(self, force=False):
+        """
+        write spooled data to disk if the fsync interval has passed
+        """
+
+        if self.unsynced_data is False:
+            return
+
+        if force is False and time.monotonic() - self.last_fsync < self.fsync_interval:
+            return
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        self.unsynced_data = False
+        self.last_fsync = time.monotonic()
+
+    def close(self):
+
+        if self._file is None:
+            return
+
+        self.sync(force=True)
+        self._file.close()
+        self._file = None
+
+# EOF
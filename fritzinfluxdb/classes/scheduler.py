@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import asyncio
+import heapq
+import itertools
+import random
+import time
+import zlib
+
+
+class ScheduledItem:
+    """
+        a single item handled by the ServiceScheduler
+    """
+
+    __slots__ = ("item", "interval", "deadline", "scheduled_deadline")
+
+    def __init__(self, item, interval, deadline):
+        self.item = item
+        self.interval = interval
+        # deadline without jitter applied
+        self.scheduled_deadline = deadline
+        self.deadline = deadline
+
+
+class ServiceScheduler:
+    """
+        Keeps track of the next due time of all scheduled items in a priority queue.
+        This way a task loop only needs to sleep until the next deadline instead of
+        checking every item every second.
+
+        All deadlines are based on the monotonic clock and the next deadline of an item
+        is calculated from its previous deadline. So intervals don't drift even if handling
+        an item takes a while.
+
+        To avoid request bursts, the first deadline of an item can be spread across its
+        interval (phase) and each deadline can be shifted by a random jitter.
+    """
+
+    # sleep time in seconds if nothing is scheduled at all
+    idle_sleep_time = 3600
+
+    # max jitter in percent of an item interval
+    max_jitter = 50
+
+    def __init__(self, jitter=0):
+        """
+        Parameters
+        ----------
+        jitter: int, float
+            max random deviation of every deadline in percent of the item interval
+        """
+
+        self._queue = list()
+        self._sequence = itertools.count()
+        self.jitter = min(max(jitter or 0, 0), self.max_jitter)
+
+    def __len__(self):
+        return len(self._queue)
+
+    def _push(self, scheduled_item):
+
+        scheduled_item.deadline = scheduled_item.scheduled_deadline
+        if self.jitter > 0:
+            max_deviation = scheduled_item.interval * self.jitter / 100
+            scheduled_item.deadline += random.uniform(-max_deviation, max_deviation)
+
+        # the sequence keeps items with the same deadline in order of scheduling
+        heapq.heappush(self._queue, (scheduled_item.deadline, next(self._sequence), scheduled_item))
+
+    def add(self, item, interval, delay=0, phase_key=None, slot=0):
+        """
+        add a new item to the scheduler
+
+        Parameters
+        ----------
+        item: object
+            the item to schedule, i.e. a FritzBoxService
+        interval: int, float
+            interval in seconds in which the item is due
+        delay: int, float
+            seconds from now until the item is due for the first time
+        phase_key: str
+            if defined, the item is due at a fixed phase within its interval which is derived
+            from this key and the slot, but not earlier than 'delay'. Use a key which is unique
+            per FritzBox (i.e. box tag and handler name) to offset the items of different boxes.
+        slot: int, float
+            position of the item within its interval as fraction between 0 and 1, added to the
+            phase of the 'phase_key'. Use 'index / number of items' to spread items of the same
+            box evenly.
+        """
+
+        if phase_key is not None and interval > 0:
+
+            # phase within the interval relative to the wall clock, stays the same across restarts
+            offset = zlib.crc32(f"{phase_key}".encode("utf-8")) / 2**32
+            phase = (offset + slot) % 1 * interval
+
+            now = time.time()
+            earliest = now + delay
+            next_phase_time = earliest - ((earliest - phase) % interval)
+            if next_phase_time < earliest:
+                next_phase_time += interval
+
+            delay = next_phase_time - now
+
+        self._push(ScheduledItem(item, interval, time.monotonic() + delay))
+
+    def reschedule(self, scheduled_item, retry_in=None):
+        """
+        schedule an item which was returned by 'pop_due_items' again
+
+        Parameters
+        ----------
+        scheduled_item: ScheduledItem
+            the item to reschedule
+        retry_in: int, float
+            if defined, the item is due again in this amount of seconds instead of the next interval
+        """
+
+        now = time.monotonic()
+
+        if retry_in is not None:
+            scheduled_item.scheduled_deadline = now + retry_in
+        else:
+            scheduled_item.scheduled_deadline += scheduled_item.interval
+
+            # skip missed deadlines if handling the item took longer than the interval
+            if scheduled_item.scheduled_deadline <= now:
+                missed_intervals = int((now - scheduled_item.scheduled_deadline) / scheduled_item.interval) + 1
+                scheduled_item.scheduled_deadline += missed_intervals * scheduled_item.interval
+
+        self._push(scheduled_item)
+
+    def seconds_until_next(self):
+        """
+        returns the number of seconds until the next item is due or None if nothing is scheduled
+        """
+
+        if len(self._queue) == 0:
+            return None
+
+        return max(0.0, self._queue[0][0] - time.monotonic())
+
+    def pop_due_items(self):
+        """
+        remove all items which are due from the scheduler and return them in order of their deadline
+        """
+
+        now = time.monotonic()
+
+        due_items = list()
+        while len(self._queue) > 0 and self._queue[0][0] <= now:
+            due_items.append(heapq.heappop(self._queue)[2])
+
+        return due_items
+
+    async def wait_for_due_items(self):
+        """
+        sleep until the next deadline and return all items which are due
+        """
+
+        while True:
+
+            due_items = self.pop_due_items()
+            if len(due_items) > 0:
+                return due_items
+
+            sleep_time = self.seconds_until_next()
+
+            await asyncio.sleep(self.idle_sleep_time if sleep_time is None else sleep_time)
+
+# EOF
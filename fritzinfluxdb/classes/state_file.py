@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import json
+import os
+import threading
+
+from fritzinfluxdb.log import get_logger
+
+log = get_logger()
+
+
+class StateFile:
+    """
+        Small JSON file to keep state across restarts.
+
+        To write the state without blocking the event loop, take a snapshot with 'snapshot()'
+        in the event loop and pass it to 'write()' in an executor.
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path: str
+            path to the state file, will be created if it doesn't exist
+        """
+
+        self.path = path
+        self.data = dict()
+
+        # version of the last snapshot and the last written snapshot
+        self.version = 0
+        self.written_version = 0
+
+        self._write_lock = threading.Lock()
+
+    def load(self):
+
+        try:
+            with open(self.path, "r") as state_file:
+                data = json.load(state_file)
+        except FileNotFoundError:
+            log.debug(f"State file '{self.path}' not found, starting without previous state")
+            return
+        except (OSError, ValueError) as e:
+            log.warning(f"Unable to read state file '{self.path}': {e}")
+            return
+
+        if not isinstance(data, dict):
+            log.warning(f"Unable to read state file '{self.path}': invalid format")
+            return
+
+        self.data = data
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value):
+        """
+        set the state of 'key'
+
+        Returns
+        -------
+        bool: True if the state has changed
+        """
+
+        if self.data.get(key) == value:
+            return False
+
+        self.data[key] = value
+
+        return True
+
+    def snapshot(self):
+        """
+        returns the current state serialized to JSON
+
+        Returns
+        -------
+        tuple: snapshot version and JSON content, or None if the state can't be serialized
+        """
+
+        try:
+            content = json.dumps(self.data)
+        except (TypeError, ValueError) as e:
+            log.error(f"Unable to write state file '{self.path}': {e}")
+            return None
+
+        self.version += 1
+
+        return self.version, content
+
+    def write(self, version, content):
+        """
+        write a snapshot to disk, unless a newer snapshot has been written already. The state
+        is written to a temporary file and synced to disk first, this way the state file is
+        always complete, even after a power loss.
+        """
+
+        temp_path = f"{self.path}.tmp"
+
+        with self._write_lock:
+            if version <= self.written_version:
+                return
+
+            try:
+                with open(temp_path, "w") as state_file:
+                    state_file.write(content)
+                    state_file.flush()
+                    os.fsync(state_file.fileno())
+
+                os.replace(temp_path, self.path)
+                self.sync_directory()
+            except OSError as e:
+                log.error(f"Unable to write state file '{self.path}': {e}")
+                return
+
+            self.written_version = version
+
+    def sync_directory(self):
+        """
+        make sure the rename of the state file has been written to disk, not supported on all platforms
+        """
+
+        # noinspection PyBroadException
+        try:
+            directory_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        except Exception:
+            return
+
+        try:
+            os.fsync(directory_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(directory_fd)
+
+    def save(self):
+        """
+        write the current state to disk
+        """
+
+        snapshot = self.snapshot()
+        if snapshot is not None:
+            self.write(*snapshot)
+
+# EOF
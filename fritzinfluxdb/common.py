@@ -9,6 +9,8 @@
 
 import sys
 import os
+from datetime import datetime
+from functools import lru_cache
 
 test_mode_state = False
 test_env_var_read = False
@@ -28,6 +30,138 @@ def do_error_exit(log_text):
     exit(1)
 
 
+class PathSegment:
+    """
+        A single segment of a CompiledPath
+    """
+
+    __slots__ = ("attribute", "key", "index", "matched_key")
+
+    def __init__(self, attribute):
+
+        self.attribute = attribute
+        self.key = attribute.lower()
+
+        try:
+            self.index = int(attribute)
+        except ValueError:
+            self.index = None
+
+        # the spelling of the key of the last dict which didn't contain the attribute as is
+        self.matched_key = None
+
+    def get_case_insensitive(self, structure: dict):
+        """
+        returns the value of the dict key which matches the segment regardless of case, or None
+        """
+
+        matched_key = self.matched_key
+        if matched_key is not None and matched_key in structure:
+            return structure[matched_key]
+
+        for key in structure:
+            if isinstance(key, str) and key.lower() == self.key:
+                self.matched_key = key
+                return structure[key]
+
+        return None
+
+
+class CompiledPath:
+    """
+        A path to get data from a complex object/json structure, split only once.
+        Behaves like 'grab()' without building any intermediate objects.
+
+        example:
+            path = CompiledPath("rows.0.elements.-1.distance.value")
+            value = path.get(data_structure, fallback=0)
+    """
+
+    # max number of path segments, longer paths always return the fallback
+    max_recursion_level = 100
+
+    __slots__ = ("path", "segments")
+
+    def __init__(self, path, separator="."):
+        """
+        Parameters
+        ----------
+        path: str
+            nested path to extract
+        separator: str
+            path separator to use. Helpful if a path element
+            contains the default (.) separator.
+        """
+
+        self.path = path
+        self.segments = tuple(PathSegment(attribute) for attribute in path.split(separator))
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}('{self.path}')"
+
+    def get(self, structure=None, fallback=None):
+        """
+        Parameters
+        ----------
+        structure: dict, list, object
+            object structure to extract data from
+        fallback: dict, list, str, int
+            data to return if no match was found
+
+        Returns
+        -------
+        str, dict, list
+            the desired path element if found, otherwise fallback
+        """
+
+        if structure is None or len(self.segments) > self.max_recursion_level:
+            return fallback
+
+        for segment in self.segments:
+            if isinstance(structure, dict):
+                data = structure.get(segment.attribute)
+                if data is None and segment.attribute not in structure:
+                    data = segment.get_case_insensitive(structure)
+                structure = data
+
+            elif isinstance(structure, list):
+                if segment.index is None:
+                    return fallback
+                try:
+                    structure = structure[segment.index]
+                except IndexError:
+                    return fallback
+
+            else:
+                # noinspection PyBroadException
+                try:
+                    structure = getattr(structure, segment.attribute)
+                except Exception:
+                    return fallback
+
+        return structure if structure is not None else fallback
+
+
+@lru_cache(maxsize=512)
+def compile_path(path, separator="."):
+    """
+    returns the CompiledPath for this path, every path is only compiled once
+
+    Parameters
+    ----------
+    path: str
+        nested path to extract
+    separator: str
+        path separator to use
+
+    Returns
+    -------
+    CompiledPath: the compiled path
+    """
+
+    return CompiledPath(path, separator)
+
+
 def grab(structure=None, path=None, separator=".", fallback=None):
     """
         get data from a complex object/json structure with a
@@ -70,43 +204,89 @@ def grab(structure=None, path=None, separator=".", fallback=None):
             the desired path element if found, otherwise None
     """
 
-    max_recursion_level = 100
-
-    current_level = 0
-    levels = len(path.split(separator))
-
     if structure is None or path is None:
         return fallback
 
-    # noinspection PyBroadException
-    def traverse(r_structure, r_path):
-        nonlocal current_level
-        current_level += 1
+    return compile_path(path, separator).get(structure, fallback)
 
-        if current_level > max_recursion_level:
-            return fallback
 
-        for attribute in r_path.split(separator):
-            if isinstance(r_structure, dict):
-                r_structure = {k.lower(): v for k, v in r_structure.items()}
+@lru_cache(maxsize=64)
+def parse_avm_date(date):
+    """
+    parse a date in the format '%d.%m.%y' which is used by the FritzBox
 
-            try:
-                if isinstance(r_structure, list):
-                    data = r_structure[int(attribute)]
-                elif isinstance(r_structure, dict):
-                    data = r_structure.get(attribute.lower())
-                else:
-                    data = getattr(r_structure, attribute)
+    Returns
+    -------
+    tuple: year, month and day
+    """
 
-            except Exception:
-                return fallback
+    day, month, year = date.split(".")
 
-            if current_level == levels:
-                return data if data is not None else fallback
-            else:
-                return traverse(data, separator.join(r_path.split(separator)[1:]))
+    # same century handling as strptime '%y'
+    year = int(year)
+    year += 2000 if year < 69 else 1900
+
+    return year, int(month), int(day)
+
+
+def parse_avm_datetime(date, time):
+    """
+    parse date and time strings as returned by the FritzBox. This is a lot faster than
+    using 'datetime.strptime()' with '%d.%m.%y %H:%M:%S' or '%d.%m.%y %H:%M'.
+
+    Parameters
+    ----------
+    date: str
+        the date as '%d.%m.%y'
+    time: str
+        the time as '%H:%M:%S' or '%H:%M'
+
+    Returns
+    -------
+    datetime: the naive datetime object
+
+    Raises
+    ------
+    ValueError: if date or time have an invalid format
+    """
+
+    year, month, day = parse_avm_date(date)
+
+    time_parts = time.split(":")
+    if len(time_parts) not in [2, 3]:
+        raise ValueError(f"invalid time format: {time}")
+
+    return datetime(year, month, day, *[int(x) for x in time_parts])
+
+
+@lru_cache(maxsize=256)
+def get_timezone_for_hour(timezone, year, month, day, hour):
+    """
+    returns the pytz time zone object with the UTC offset which is valid for this hour
+    """
+
+    return timezone.localize(datetime(year, month, day, hour)).tzinfo
+
+
+def localize(timezone, timestamp):
+    """
+    make a naive datetime object time zone aware. The same as 'timezone.localize(timestamp)' but the UTC
+    offset is cached for every hour, as daylight saving time changes always happen at the full hour.
+
+    Parameters
+    ----------
+    timezone: pytz.tzinfo.BaseTzInfo
+        the pytz time zone
+    timestamp: datetime
+        the naive datetime object
+
+    Returns
+    -------
+    datetime: the time zone aware datetime object
+    """
 
-    return traverse(structure, path)
+    return timestamp.replace(tzinfo=get_timezone_for_hour(timezone, timestamp.year, timestamp.month,
+                                                          timestamp.day, timestamp.hour))
 
 
 def in_test_mode():
@@ -7,6 +7,7 @@
 #  For a copy, see file LICENSE.txt included in this
 #  repository or visit: <https://opensource.org/licenses/MIT>.
 
+import asyncio
 import logging
 from logging.handlers import QueueHandler
 import sys
@@ -29,7 +30,31 @@ def get_logger():
     return logging.getLogger("fritzinfluxdb")
 
 
-def setup_logging(log_level=None, run_as_daemon=False, log_queue=None):
+class EventLoopQueueHandler(QueueHandler):
+    """
+    QueueHandler for an asyncio.Queue which can also be used from threads other than the one
+    running the event loop. The asyncio.Queue is not thread safe, so log records emitted
+    in a thread pool executor are handed over to the event loop.
+    """
+
+    def __init__(self, queue, loop=None):
+        super().__init__(queue)
+        self.loop = loop
+
+    def enqueue(self, record):
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if self.loop is None or running_loop is self.loop or self.loop.is_running() is False:
+            self.queue.put_nowait(record)
+        else:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, record)
+
+
+def setup_logging(log_level=None, run_as_daemon=False, log_queue=None, loop=None):
     """
     Set up logging for the whole program and return a log handler
 
@@ -41,6 +66,8 @@ def setup_logging(log_level=None, run_as_daemon=False, log_queue=None):
         define if tool is running as daemon to omit log time stamp
     log_queue: asyncio.Queue
         queue object to write logs to which should be sent to InfluxDB
+    loop: asyncio.AbstractEventLoop
+        the event loop the log_queue is consumed in
 
     Returns
     -------
@@ -73,7 +100,7 @@ def setup_logging(log_level=None, run_as_daemon=False, log_queue=None):
     logger.addHandler(log_stream)
 
     # add handler to write logs to InfluxDB log queue
-    queue_handler = QueueHandler(log_queue)
+    queue_handler = EventLoopQueueHandler(log_queue, loop)
     queue_handler.setLevel(logging.INFO)
     logger.addHandler(queue_handler)
 